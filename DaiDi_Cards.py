@@ -0,0 +1,97 @@
+'''
+Integer card encoding used by the game classes and the GameBot
+
+Each card is an int from 0 to 51 and a hand is a 52-bit mask of those ints
+The id of a card is 4*number + suit, so sorting ids sorts cards by Dai Di value
+i.e. 0 is the Diamond 3 and 51 is the Spade 2
+
+Tuple cards such as ('D', '3') are only used for input and display
+'''
+
+SUITS = ("D", "C", "H", "S")
+NUMBERS = ("3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A", "2")
+
+# Tuple form of every card, indexed by card id
+CARD_TUPLES = tuple((suit, number) for number in NUMBERS for suit in SUITS)
+CARD_IDS = {card: i for i, card in enumerate(CARD_TUPLES)}
+
+# Value of every card, same convention as Player.card_value (10*number + suit)
+CARD_VALUES = tuple(10 * (i >> 2) + (i & 3) for i in range(52))
+
+FULL_DECK = (1 << 52) - 1
+DIAMOND_3 = 0
+
+# Masks of all the cards of a suit and of all the cards of a number
+SUIT_MASKS = tuple(sum(1 << (4 * num + suit) for num in range(13)) for suit in range(4))
+NUMBER_MASKS = tuple(0xF << (4 * num) for num in range(13))
+
+try:
+    popcount = int.bit_count
+
+except AttributeError: # Python < 3.10
+    def popcount(mask):
+        return bin(mask).count("1")
+
+
+# Returns the id of a card given as an id or a tuple
+# Returns None if the card does not exist
+def card_id(card):
+    if isinstance(card, int):
+        return card if 0 <= card < 52 else None
+
+    try:
+        return CARD_IDS.get(tuple(card))
+
+    except TypeError:
+        return None
+
+
+# Returns the ids of a list of cards, None for cards that do not exist
+def card_ids(cards):
+    return [card_id(card) for card in cards]
+
+
+# Returns the mask of a list of cards
+# Raises ValueError if a card does not exist
+def cards_mask(cards):
+    mask = 0
+    for card in cards:
+        cid = card_id(card)
+        if cid is None:
+            raise ValueError(f"Not a card: {card}")
+        mask |= 1 << cid
+
+    return mask
+
+
+# Returns the ids in a mask, lowest card first
+def mask_ids(mask):
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+
+    return ids
+
+
+# Returns the tuple cards in a mask, lowest card first
+def mask_cards(mask):
+    return [CARD_TUPLES[i] for i in mask_ids(mask)]
+
+
+# Range of hand strengths used to balance deals
+# Average player hand should have a strength of 800 (799.5)
+BALANCE_RANGE = (650, 900)
+
+
+# Returns the strengths (sum of card values) of the four hands dealt from a deck of ids
+def deal_strengths(deck):
+    return [sum(map(CARD_VALUES.__getitem__, deck[i::4])) for i in range(4)]
+
+
+# Returns the value of a card given as an id or a tuple
+def card_value(card):
+    if isinstance(card, int):
+        return CARD_VALUES[card]
+    return CARD_VALUES[CARD_IDS[card]]
@@ -0,0 +1,149 @@
+'''
+Samplers for balanced deals
+
+A deal is balanced when the strengths (sum of card values) of the four hands dealt from the deck,
+deck[i::4], are all between low and high
+
+balance_by_rejection reshuffles until the deal is balanced, which can take very long for tight ranges
+balance_by_swaps shuffles once and then swaps cards between a too strong and a too weak hand
+Every swap lowers the sum of squared differences between the hand strengths and the mean strength by at least 2,
+so the number of swaps after a shuffle is at most half that sum
+A new shuffle is only needed if no swap between any two hands helps, which does not happen
+for ranges around the mean strength such as the default one
+After MAX_SHUFFLES shuffles balance_by_swaps gives up and raises ValueError, so its cost is always bounded
+Strengths are whole numbers, ranges that no four whole strengths adding up to the total fit in are refused at once
+'''
+
+from math import ceil, floor
+from time import perf_counter
+from random import Random
+from DaiDi_Cards import BALANCE_RANGE, CARD_VALUES, deal_strengths
+
+# Mean hand strength of a deal (3198 / 4)
+MEAN_STRENGTH = sum(CARD_VALUES) / 4
+
+MAX_SHUFFLES = 100
+
+
+# Reshuffles the deck in place until it deals balanced hands
+# Returns the number of shuffles
+def balance_by_rejection(deck, rng, low=BALANCE_RANGE[0], high=BALANCE_RANGE[1]):
+    shuffles = 0
+
+    while True:
+        rng.shuffle(deck)
+        shuffles += 1
+        strengths = deal_strengths(deck)
+
+        if min(strengths) >= low and max(strengths) <= high:
+            return shuffles
+
+
+# Returns the swaps (index in strong hand, index in weak hand) that move two hands closer together
+def improving_swaps(strong_hand, weak_hand, gap):
+    return [(i, j) for i, strong in enumerate(strong_hand) for j, weak in enumerate(weak_hand)
+            if 0 < CARD_VALUES[strong] - CARD_VALUES[weak] < gap]
+
+
+# Shuffles the deck in place once and swaps cards between hands until it deals balanced hands
+# Each swap is picked at random among the swaps between the strongest and the weakest hand that bring them closer
+# Returns the number of swaps, raises ValueError if the range cannot be reached or max_shuffles shuffles were not enough
+def balance_by_swaps(deck, rng, low=BALANCE_RANGE[0], high=BALANCE_RANGE[1], max_shuffles=MAX_SHUFFLES):
+    # Four whole strengths between low and high must add up to the strength of the whole deck
+    if not ceil(low) <= MEAN_STRENGTH <= floor(high):
+        raise ValueError(f"The range {low} to {high} does not contain the mean hand strength {MEAN_STRENGTH} "
+                         f"with whole strengths")
+
+    rng.shuffle(deck)
+    hands = [deck[i::4] for i in range(4)]
+    strengths = [sum(map(CARD_VALUES.__getitem__, hand)) for hand in hands]
+    swaps = 0
+    shuffles = 1
+
+    while min(strengths) < low or max(strengths) > high:
+        order = sorted(range(4), key=strengths.__getitem__)
+        strong, weak = order[-1], order[0]
+        candidates = improving_swaps(hands[strong], hands[weak], strengths[strong] - strengths[weak])
+
+        # The strongest and the weakest hand cannot get closer, try the other pairs of hands
+        if not candidates:
+            for strong, weak in ((3, 1), (2, 0), (3, 2), (1, 0), (2, 1)):
+                strong, weak = order[strong], order[weak]
+                candidates = improving_swaps(hands[strong], hands[weak], strengths[strong] - strengths[weak])
+                if candidates:
+                    break
+
+            # No swap improves the deal, start again from a new shuffle
+            else:
+                if shuffles >= max_shuffles:
+                    raise ValueError(f"Could not balance the deal between {low} and {high} in {shuffles} shuffles")
+
+                shuffles += 1
+                rng.shuffle(deck)
+                hands = [deck[i::4] for i in range(4)]
+                strengths = [sum(map(CARD_VALUES.__getitem__, hand)) for hand in hands]
+                continue
+
+        i, j = rng.choice(candidates)
+        strong_card, weak_card = hands[strong][i], hands[weak][j]
+        hands[strong][i], hands[weak][j] = weak_card, strong_card
+        strengths[strong] += CARD_VALUES[weak_card] - CARD_VALUES[strong_card]
+        strengths[weak] += CARD_VALUES[strong_card] - CARD_VALUES[weak_card]
+        swaps += 1
+
+    for i in range(4):
+        deck[i::4] = hands[i]
+
+    return swaps
+
+
+# Returns the total variation distance between two histograms given as dicts
+def variation_distance(histogram, other):
+    total = sum(histogram.values())
+    other_total = sum(other.values())
+    return sum(abs(histogram.get(key, 0) / total - other.get(key, 0) / other_total)
+               for key in set(histogram) | set(other)) / 2
+
+
+# Samples n_deals deals with both methods and returns a text report comparing them
+# Compares the time per deal, the hand strengths (in bins of 10), the gap between the strongest and weakest hand
+# and the number of 2's in each hand
+def deal_report(n_deals=10000, seed=0, low=BALANCE_RANGE[0], high=BALANCE_RANGE[1]):
+    results = {}
+
+    for name, method in (('rejection', balance_by_rejection), ('swaps', balance_by_swaps)):
+        rng = Random(seed)
+        deck = list(range(52))
+        steps = 0
+        gap_total = 0
+        strength_hist, gap_hist, twos_hist = {}, {}, {}
+
+        start = perf_counter()
+        for _ in range(n_deals):
+            steps += method(deck, rng, low, high)
+            strengths = deal_strengths(deck)
+            gap = max(strengths) - min(strengths)
+            gap_total += gap
+            gap_hist[gap // 10] = gap_hist.get(gap // 10, 0) + 1
+
+            for i in range(4):
+                strength_hist[strengths[i] // 10] = strength_hist.get(strengths[i] // 10, 0) + 1
+                twos = sum(card >= 48 for card in deck[i::4])
+                twos_hist[twos] = twos_hist.get(twos, 0) + 1
+        elapsed = perf_counter() - start
+
+        results[name] = {'time': elapsed / n_deals, 'steps': steps / n_deals, 'strength': strength_hist,
+                         'gap': gap_hist, 'twos': twos_hist,
+                         'mean_gap': gap_total / n_deals}
+
+    rejection, swaps = results['rejection'], results['swaps']
+    lines = [f"Balanced deals between {low} and {high}, {n_deals} deals each",
+             f"Rejection: {rejection['time'] * 1e6:.0f} us per deal, {rejection['steps']:.1f} shuffles per deal, "
+             f"mean gap {rejection['mean_gap']:.0f}",
+             f"Swaps: {swaps['time'] * 1e6:.0f} us per deal, {swaps['steps']:.1f} swaps per deal, "
+             f"mean gap {swaps['mean_gap']:.0f}",
+             f"Total variation distance of hand strengths: {variation_distance(rejection['strength'], swaps['strength']):.3f}",
+             f"Total variation distance of gaps: {variation_distance(rejection['gap'], swaps['gap']):.3f}",
+             f"Total variation distance of 2's per hand: {variation_distance(rejection['twos'], swaps['twos']):.3f}"]
+
+    return '\n'.join(lines)
@@ -9,53 +9,102 @@ Note: for the hands A2345 and 23456, the A and the 2 are considered "small"
 2AKQJ is not considered a valid hand
 '''
 
-from random import shuffle
-from collections import Counter
-from itertools import product
+from random import Random, SystemRandom
+from DaiDi_Cards import (BALANCE_RANGE, CARD_TUPLES, FULL_DECK, SUIT_MASKS, DIAMOND_3,
+                         card_ids, cards_mask, mask_cards, card_value, popcount)
+from DaiDi_Deal import balance_by_swaps
+from DaiDi_Hands import HAND_NAMES, KEY_SIZE_SHIFT, classify, hand_key, key_mask
 
 
 # Class of player
+# The hand is kept as a bitmask of card ids (see DaiDi_Cards) with its number of cards
+# Removing cards updates the count without counting the hand again
+# hand and the suited lists are views of the mask in tuple form, built when they are first used after a change
+# Every use returns a new list, changing it does not change the hand
 class Player:
     def __init__(self, nickname="", discord_name="", discord_id=0):
         self.nickname = nickname
         self.discord_name = discord_name # Discord name and id are not necessary
         self.discord_id = discord_id # Only used by discord bot
-        self.hand = []
-        self.diamonds = []
-        self.clubs = []
-        self.hearts = []
-        self.spades = []
+        self.views = {}
+        self.mask = 0
 
 
-    # Function to return the value of a card
-    # Follows the convention of Dai Di (2 being the highest value )
-    def card_value(self, card):
-        suit = ["D", "C", "H", "S"].index(card[0])
-        num = ["3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A", "2"].index(card[1])
+    @property
+    def mask(self):
+        return self._mask
 
-        return 10*num + suit
 
+    # Setting the mask (e.g. when dealing) counts the cards again
+    @mask.setter
+    def mask(self, mask):
+        self._mask = mask
+        self.card_count = popcount(mask)
+        self.views.clear()
 
-    # Function to sort hands according to value
-    # Also fills in the suited lists
-    def sort_hand(self):
-        if self.hand == []:
-            return False
 
-        self.hand.sort(key=self.card_value)
+    # Removes the cards of a mask from the hand, cards not in the hand are ignored
+    def remove_cards(self, mask):
+        removed = mask & self._mask
+        self._mask ^= removed
+        self.card_count -= popcount(removed)
+        self.views.clear()
+
+
+    # Returns the cards of the hand in a mask as a new list
+    # The cards are cached as a tuple until the hand changes
+    def view(self, key, mask=FULL_DECK):
+        cards = self.views.get(key)
+        if cards is None:
+            cards = self.views[key] = tuple(mask_cards(self._mask & mask))
+        return list(cards)
+
+
+    @property
+    def hand(self):
+        return self.view('hand')
+
+
+    @hand.setter
+    def hand(self, cards):
+        self.mask = cards_mask(cards)
+
+
+    @property
+    def diamonds(self):
+        return self.view(0, SUIT_MASKS[0])
+
+
+    @property
+    def clubs(self):
+        return self.view(1, SUIT_MASKS[1])
+
+
+    @property
+    def hearts(self):
+        return self.view(2, SUIT_MASKS[2])
+
+
+    @property
+    def spades(self):
+        return self.view(3, SUIT_MASKS[3])
+
+
+    # Function to return the value of a card
+    # Follows the convention of Dai Di (2 being the highest value )
+    def card_value(self, card):
+        return card_value(card)
 
-        self.diamonds = [card for card in self.hand if card[0] == 'D']
-        self.clubs = [card for card in self.hand if card[0] == 'C']
-        self.hearts = [card for card in self.hand if card[0] == 'H']
-        self.spades = [card for card in self.hand if card[0] == 'S']
 
-        self.hand.sort(key=self.card_value)
-        return True
+    # The mask is always in card order so there is nothing to sort
+    # Kept so callers can still check if the hand is empty
+    def sort_hand(self):
+        return self.mask != 0
 
 
     # Function to check if hand is playable
     def can_play(self, cards=None):
-        if self.hand == []: # First checks if hand is empty
+        if self.mask == 0: # First checks if hand is empty
             print("No cards to play")
             return (False, "No cards to play")
 
@@ -69,15 +118,15 @@ class Player:
 
         else:
             # Checks if cards played belong to hand
-            cards_check = sum(map(lambda x: int(x in self.hand), cards))
-            cards_len = len(cards)
+            missing = [card for card, cid in zip(cards, card_ids(cards))
+                       if cid is None or not self.mask >> cid & 1]
 
-            if cards_check == cards_len:
+            if not missing:
                 return (True, f"Played the cards: {cards}")
 
             else:
-                print(f"You don't have these cards:\n{[card for card in cards if card not in self.hand]}")
-                return (False, f"You don't have these cards:\n{[card for card in cards if card not in self.hand]}")
+                print(f"You don't have these cards:\n{missing}")
+                return (False, f"You don't have these cards:\n{missing}")
 
 
     # Plays the card and returns card(s) if card(s) is in hand
@@ -87,45 +136,59 @@ class Player:
         cards_status = self.can_play(cards)
 
         if cards_status[0] == True:
-            for card in cards:
-                self.hand.remove(card) # Removes cards from hand
+            self.remove_cards(cards_mask(cards)) # Removes cards from hand
 
-            self.sort_hand() # Resorts hand
         return (True, cards_status[1]) # Status text is returned
 
 
 # Class of Game
+# The deck is a list of card ids (see DaiDi_Cards)
+# Each game shuffles with its own random number generator, so a deal can be replayed from its seed
+# A seed is drawn at random when neither a seed nor a generator is given
 class Dai_Di:
-    def __init__(self, player_list=None):
+    def __init__(self, player_list=None, seed=None, rng=None):
         self.suits = ["D", "C", "H", "S"]
         self.number = ["3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A", "2"]
-        self.deck_list = list(product(self.suits, self.number))
+        self.deck_list = list(range(52))
         self.play_area = []
         if isinstance(player_list, (list,)):
             self.players = player_list
         else:
             self.players = []
 
+        if rng is None:
+            self.seed = seed if seed is not None else SystemRandom().randrange(2**63)
+            self.rng = Random(self.seed)
+        else:
+            self.seed = seed
+            self.rng = rng
+
 
     # Prints out deck
     def show_deck(self):
         for i in self.deck_list:
-            print(i)
+            print(CARD_TUPLES[i])
 
 
     # Shuffles deck
     def shuffle_deck(self):
-        shuffle(self.deck_list)
+        self.rng.shuffle(self.deck_list)
 
         # Checks if one player has 3 or more '2' cards
         # If so, reshuffles deck
         for i in range(4):
-            if len([card[1] if card[1] == '2' else None for card in self.deck_list[i::4]]) > 2:
-                shuffle(self.deck_list)
+            if sum(card >= 48 for card in self.deck_list[i::4]) > 2:
+                self.rng.shuffle(self.deck_list)
 
         return self.deck_list
 
 
+    # Shuffles the deck and swaps cards between hands until the four hands it deals have strengths between low and high
+    # Returns the number of swaps (see DaiDi_Deal)
+    def balance_deck(self, low=BALANCE_RANGE[0], high=BALANCE_RANGE[1]):
+        return balance_by_swaps(self.deck_list, self.rng, low, high)
+
+
     # Returns index of suit or number
     def index_func(self, string, small_aces=False):
         # Checks if string is in suits
@@ -145,7 +208,7 @@ class Dai_Di:
     # Returns the starting player i.e. the player with the Diamond 3 (D, 3) card
     def starting_player(self):
         for plyr in self.players:
-            if ('D', '3') in plyr.hand:
+            if plyr.mask >> DIAMOND_3 & 1:
                 return self.players.index(plyr)
 
         return False
@@ -156,17 +219,12 @@ class Dai_Di:
     def deal_cards(self):
         if len(self.players) == 4:
 
-            self.players[0].hand = self.deck_list[0::4]
-            self.players[1].hand = self.deck_list[1::4]
-            self.players[2].hand = self.deck_list[2::4]
-            self.players[3].hand = self.deck_list[3::4]
+            self.players[0].mask = cards_mask(self.deck_list[0::4])
+            self.players[1].mask = cards_mask(self.deck_list[1::4])
+            self.players[2].mask = cards_mask(self.deck_list[2::4])
+            self.players[3].mask = cards_mask(self.deck_list[3::4])
             self.deck_list = []
 
-            self.players[0].sort_hand()
-            self.players[1].sort_hand()
-            self.players[2].sort_hand()
-            self.players[3].sort_hand()
-
             print(f"""Player 1: {self.players[0].hand}\n\n
 Player 2: {self.players[1].hand}\n\n
 Player 3: {self.players[2].hand}\n\n
@@ -181,133 +239,66 @@ Player 4: {self.players[3].hand}\n\n""")
     # Assigns values to differentiate cards
     # Outputs the same value as the Player.card_value function
     def card_value(self, card):
-        suit = self.index_func(card[0])
-        num = self.index_func(card[1])
-
-        return 10*num + suit
+        return card_value(card)
 
 
     # Function to check if cards form a straight
     def isstraight(self, lst):
         # Checks if list can be sorted
-        try:
-            lst.sort(key=self.card_value)
-
-        except ValueError:
+        ids = card_ids(lst)
+        if None in ids:
             print("Select correct card(s)")
             return False
 
+        lst.sort(key=self.card_value)
+
         # List of index of the cards' numbers
-        lst = [self.index_func(card[1]) for card in lst]
-        lst.sort()
-        # Range from the lowest number to the highest number
-        checker = list(range(lst[0], lst[-1] + 1))
+        numbers = sorted(cid >> 2 for cid in ids)
 
-        return lst == checker
+        return numbers == list(range(numbers[0], numbers[-1] + 1))
 
 
     # Function to check type of hand
     # Only checks for hand type, whether hand is playable or not is checked seperately
     # Order of input does not affect result
+    # The type is looked up in the precomputed table of valid hands (see DaiDi_Hands)
     def hand_type(self, cards=None):
         length = len(cards) # Number of cards being played
-        number_checker = len({card[1] for card in cards}) # The set of unique card number
-        suit_checker = len({card[0] for card in cards}) # The set of unique card suits
-        cards.sort(key=self.card_value)
 
         # The hands are ranked as:
         # Single, pair, three of a kind, straight, flush, full house, four of a kind, straight flush
         # Royal flushes are not significantly different from other straight flushes but they are still highlighted
-        # [J, Q, K, A, 2] and [2, 3, 4, 5, 6] are NOT counted as proper Straights
+        # [J, Q, K, A, 2] is NOT counted as a proper Straight
 
         if length == 0:
             txt_blurb = "No cards played"
             return (False, txt_blurb)
 
-        elif length == 1:
-            txt_blurb = f"played the Single Card: {cards[0]}"
-            return (1, txt_blurb)
-
-        elif length == 2:
+        ids = card_ids(cards)
+        if None in ids:
+            return (False, "Select correct card(s)")
 
-            if number_checker == 1 and suit_checker == 2: # 1 unique card number and 2 unique suits
-                txt_blurb = f"played the Pair: {cards[0]} {cards[1]}"
-                return (2, txt_blurb)
+        classified = classify(ids)
 
-            else:
+        if classified is None:
+            if length == 2:
                 txt_blurb = "That is not a pair"
-                return (False, txt_blurb)
-
-        elif length == 3:
-
-            if number_checker == 1 and suit_checker == 3: # 1 unique card number and 3 unique suits
-                txt_blurb = f"played the Three of a Kind: {cards[0]}, {cards[1]} {cards[2]}"
-                return (3, txt_blurb)
-
-            else:
+            elif length == 3:
                 txt_blurb = "That is not a Three of a Kind"
-                return (False, txt_blurb)
-
-        elif length == 5:
-            card_numbers = [card[1] for card in cards] # Only need the number of the cards to determine the hand type
-
-            # Checks if cards form a "proper" straight
-            if (self.isstraight(cards) and
-                card_numbers != ["J", "Q", "K", "A", "2"]):
-
-                # Checks if cards form a Royal Flush
-                # Checks for the appropriate card numbers and if cards are of only one suit
-                if (card_numbers == ["10", "J", "Q", "K", "A"]
-                    and len(set([card[0] for card in cards])) == 1):
-                    txt_blurb = f"played the Royal Flush: {cards[0]}, {cards[1]}, {cards[2]}, {cards[3]}, {cards[4]}"
-
-                    # The digit in output is used to check if current hand beats previous hand
-                    return (9, txt_blurb)
-
-                # Checks if straight cards only have one suit (Straight Flush)
-                elif suit_checker == 1:
-                    txt_blurb = f"played the Straight Flush: {cards[0]}, {cards[1]}, {cards[2]}, {cards[3]}, {cards[4]}"
-                    return (8, txt_blurb)
-
-                # Otherwise cards form a normal Straight
-                else:
-                    txt_blurb = f"played the Straight: {cards[0]}, {cards[1]}, {cards[2]}, {cards[3]}, {cards[4]}"
-                    return (4, txt_blurb)
-
-            else: # Cards do not form a "proper" Straight
-                if suit_checker == 1: # Checks if cards form a Flush
-                    txt_blurb = f"played the Flush: {cards[0]}, {cards[1]}, {cards[2]}, {cards[3]}, {cards[4]}"
-                    return (5, txt_blurb)
-
-                # Move on to check more 'unusual' hands
-                # Cards have at 2 unique numbers
-                elif number_checker == 2:
-                    cards_content = Counter([card[1] for card in cards]) # Counts number of cards with the same number
-                    cards_counter = list(cards_content.items()) # Converts counter into list
-                    cards_checker = {ind[1] for ind in cards_counter} # Set of count values
-
-                    if cards_checker == {2, 3}: # 1 Pair + 1 Three of a Kind
-                        txt_blurb = f"played the Full House: {cards[0]}, {cards[1]}, {cards[2]}, {cards[3]}, {cards[4]}"
-                        return (6, txt_blurb)
-
-                    elif cards_checker == {1, 4}: # Four of a Kind + 1 Kicker
-                        txt_blurb = f"played the Four of a Kind: {cards[0]}, {cards[1]}, {cards[2]}, {cards[3]}, {cards[4]}"
-                        return (7, txt_blurb)
-
-                    else: # Cards don't form a Full House or a Four of a Kind
-                        txt_blurb = "Invalid combination of cards"
-                        return (False, txt_blurb)
-
-                else: # Cards are not one of the five five-card combinations
-                    txt_blurb = "Invalid combination of cards"
-                    return (False, txt_blurb)
-
-        else: # Tried to play more than five cards
-            txt_blurb = "Invalid combination of cards"
+            else:
+                txt_blurb = "Invalid combination of cards"
             return (False, txt_blurb)
 
+        cards.sort(key=self.card_value)
+        shown = ", ".join(str(CARD_TUPLES[cid]) for cid in sorted(ids))
+
+        # The digit in output is used to check if current hand beats previous hand
+        txt_blurb = f"played the {HAND_NAMES[classified[0]]}: {shown}"
+        return (classified[0], txt_blurb)
+
 
     # Function to check if current played hand is valid
+    # Whether a hand beats the last played hand is a comparison of hand keys (see DaiDi_Hands)
     def can_play(self, player=Player(), cards=None, skip_turn=False):
         turn = len(self.play_area)
 
@@ -329,24 +320,17 @@ Player 4: {self.players[3].hand}\n\n""")
             print("Please select cards to play.")
             return (False, "Please select cards to play.")
 
+        play_type = self.hand_type(cards)
+
         # Checks if cards form a valid hand
-        elif self.hand_type(cards)[0] is False:
+        if play_type[0] is False:
             print("Please play a valid hand")
             return (False, "Please play a valid hand")
 
         # Start of the game
         if turn == 0:
-            if ("D", "3") in cards: # Diamond 3 must be played first
-
-                if player.can_play(cards)[0] is False: # Checks if cards can be played
-                    return (False, player.can_play(cards)[1]) # Outputs status text
-
-                # Appends relevant information to the play_area
-                play_type = self.hand_type(cards)
-                self.play_area.append((cards, player.nickname, play_type))
-
-                print(f"{player.nickname} {play_type[1]}")
-                return (True, f"{player.nickname} {play_type[1]}")
+            if DIAMOND_3 in card_ids(cards): # Diamond 3 must be played first
+                return self.add_play(player, cards, play_type)
 
             else:
                 print("You must play the Diamond 3 at the start")
@@ -355,182 +339,35 @@ Player 4: {self.players[3].hand}\n\n""")
         # Checks if current player and last player is the same
         # If true, any valid hand is playable
         elif self.play_area[-1][1] == player.nickname:
+            return self.add_play(player, cards, play_type)
 
-            if player.can_play(cards)[0] is False:
-                return (False, player.can_play(cards)[1])
+        previous_play_type = self.play_area[-1][2]
+        current_key = hand_key(cards)
+        previous_key = self.play_area[-1][4]
 
-            # Appends relevant information to the play_area
-            current_play_type = self.hand_type(cards)
-            self.play_area.append((cards, player.nickname, current_play_type))
-            print(f"{player.nickname} {current_play_type[1]}")
-
-            return (True, f"{player.nickname} {current_play_type[1]}")
+        # Hands can only be played on hands with the same number of cards
+        if current_key >> KEY_SIZE_SHIFT != previous_key >> KEY_SIZE_SHIFT:
+            return (False, "Invalid hand")
 
+        elif current_key > previous_key:
+            return self.add_play(player, cards, play_type)
 
         else:
-            # Has seperate cases for the hands A2345 and 23456#
-            # Type, suits and numbers of the cards in the current hand
-            current_play_type = self.hand_type(cards)
-            current_suits = [self.index_func(card[0]) for card in cards]
-            if ({card[1] for card in cards} == {'A', '2', '3', '4', '5'}
-                or {card[1] for card in cards} == {'2', '3', '4', '5', '6'}):
-
-                current_numbers = [self.index_func(card[1], small_aces=True) for card in cards]
-
-            else:
-                current_numbers = [self.index_func(card[1]) for card in cards]
-
-            # Type, suits and numbers of the cards in the last played hand
-            previous_play_type = self.play_area[-1][2]
-            previous_suits = [self.index_func(card[0]) for card in self.play_area[-1][0]]
-            if ({card[1] for card in self.play_area[-1][0]} == {'A', '2', '3', '4', '5'}
-                or {card[1] for card in cards} == {'2', '3', '4', '5', '6'}):
-
-                current_numbers = [self.index_func(card[1], small_aces=True) for card in self.play_area[-1][0]]
-
-            else:
-                previous_numbers = [self.index_func(card[1]) for card in self.play_area[-1][0]]
-
-            # Checks if last played hand is a five-card combination
-            if previous_play_type[0] > 3:
-                # Checks if current hand beats last played hand
-                if current_play_type[0] > previous_play_type[0]:
-                    # Checks if currnet hand is playable
-                    if player.can_play(cards)[0] is False:
-                        return (False, player.can_play(cards)[1])
-
-                    # Appends relevant information to the play_area
-                    self.play_area.append((cards, player.nickname, current_play_type))
-                    print(f"{player.nickname} {current_play_type[1]}")
-
-                    return (True, f"{player.nickname} {current_play_type[1]}")
-
-                # Straight, flush and straight flush superiority is calculated using standard number then suit
-                # Comparing numers is bypassed for Royal Flushes
-
-                # Checks if current play type and last played type are the same
-                # Focuses on hand types where 'highest card wins'
-                elif (current_play_type[0] == previous_play_type[0] and
-                      current_play_type[0] in [4, 5, 8, 9]):
-
-                    # For Royal Flushes only checking suits is necessary
-                    if (current_play_type[0] == 9 and
-                        max(current_suits) > max(previous_suits)):
-
-                        if player.can_play(cards)[0] is False:
-                            return (False, player.can_play(cards)[1])
-
-                        # Appends relevant information to the play_area
-                        self.play_area.append((cards, player.nickname, current_play_type))
-                        print(f"{player.nickname} {current_play_type[1]}")
-
-                        return (True, f"{player.nickname} {current_play_type[1]}")
-
-                    # Checks if current highest card is higher than last played highest card
-                    elif max(current_numbers) > max(previous_numbers):
-
-                        if player.can_play(cards)[0] is False:
-                            return (False, player.can_play(cards)[1])
-
-                        # Appends relevant information to the play_area
-                        self.play_area.append((cards, player.nickname, current_play_type))
-                        print(f"{player.nickname} {current_play_type[1]}")
-
-                        return (True, f"{player.nickname} {current_play_type[1]}")
-
-                    # In case the highest cards are equal, check suits instead
-                    elif (max(current_numbers) == max(previous_numbers) and
-                        max(current_suits) > max(previous_suits)):
-
-                        if player.can_play(cards)[0] is False:
-                            return (False, player.can_play(cards)[1])
-
-                        # Appends relevant information to the play_area
-                        self.play_area.append((cards, player.nickname, current_play_type))
-                        print(f"{player.nickname} {current_play_type[1]}")
+            print(f"{play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
 
-                        return (True, f"{player.nickname} {current_play_type[1]}")
+            return (False, f"{play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
 
-                    else:
-                        print(f"{current_play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
 
-                        return (False, f"{current_play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
+    # Checks if player holds the cards and appends the hand to the play_area
+    # Entries are (cards, nickname, hand type, mask of the cards, hand key)
+    def add_play(self, player, cards, play_type):
+        player_status = player.can_play(cards)
+        if player_status[0] is False: # Checks if cards can be played
+            return player_status # Outputs status text
 
-                # Checking Full Houses or Four of a Kinds
-                elif (current_play_type[0] == previous_play_type[0] and
-                    current_play_type[0] in [6, 7]):
-                    previous_cards = self.play_area[-1][0]
+        # Appends relevant information to the play_area
+        mask = cards_mask(cards)
+        self.play_area.append((mask_cards(mask), player.nickname, play_type, mask, key_mask(mask)))
+        print(f"{player.nickname} {play_type[1]}")
 
-                    # Looks for the 'main body' and the 'kicker' of the current hand
-                    current_main = [card for card in cards if card[1] == cards[0][1]]
-                    current_kicker = [card for card in cards if card[1] == cards[-1][1]]
-
-                    # Looks for the 'main body' and the 'kicker' of the last played hand
-                    previous_main = [card for card in previous_cards if card[1] == previous_cards[0][1]]
-                    previous_kicker = [card for card in previous_cards if card[1] == previous_cards[0][1]]
-
-                    # If 'kicker' is longer than the 'main body', swap the two
-                    if len(current_kicker) > len(current_main):
-                        current_main = [card for card in cards if card[1] == cards[-1][1]]
-                        del current_kicker
-
-                    if len(previous_kicker) > len(previous_main):
-                        previous_main = [card for card in self.play_area[-1][0] if card[1] == self.play_area[-1][0][-1][1]]
-                        del previous_kicker
-
-                    # Comparing the number of the current and last played 'main bodies'
-                    current_main_numbers = self.index_func(current_main[0])
-                    previous_main_numbers = self.index_func(current_main[0])
-
-                    if current_main_numbers > previous_main_numbers:
-
-                        if player.can_play(cards)[0] is False:
-                            return (False, player.can_play(cards)[1])
-
-                        # Appends relevant information to the play_area
-                        self.play_area.append((cards, player.nickname, current_play_type))
-                        print(f"{player.nickname} {current_play_type[1]}")
-
-                        return (True, f"{player.nickname} {current_play_type[1]}")
-
-                    else:
-                        print(f"{current_play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
-
-                        return (False, f"{current_play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
-
-            # Dealing with the case of Single Cards, Pairs and Triples
-            elif (previous_play_type[0] <= 3 and 
-                  current_play_type[0] == previous_play_type[0]):
-
-                # Number of current hand is higher than the number of the last played hand
-                if max(current_numbers) > max(previous_numbers):
-
-                    if player.can_play(cards)[0] is False:
-                        return (False, player.can_play(cards)[1])
-
-                    # Appends relevant information to the play_area
-                    self.play_area.append((cards, player.nickname, current_play_type))
-                    print(f"{player.nickname} {current_play_type[1]}")
-
-                    return (True, f"{player.nickname} {current_play_type[1]}")
-
-                # If numbers are equal, check suits instead
-                elif (max(current_numbers) == max(previous_numbers) and
-                      max(current_suits) > max(previous_suits)):
-
-                    if player.can_play(cards)[0] is False:
-                        return (False, player.can_play(cards)[1])
-
-                    # Appends relevant information to the play_area
-                    self.play_area.append((cards, player.nickname, current_play_type))
-                    print(f"{player.nickname} {current_play_type[1]}")
-
-                    return (True, f"{player.nickname} {current_play_type[1]}")
-
-                else:
-                    print(f"{current_play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
-
-                    return (False, f"{current_play_type[1][11:]} does not beat {previous_play_type[1][11:]}")
-
-            else:
-                return (False, "Invalid hand")
+        return (True, f"{player.nickname} {play_type[1]}")
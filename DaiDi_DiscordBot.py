@@ -10,8 +10,20 @@ Note: for the hands A2345 and 23456, the A and the 2 are considered "small"
 # Dependencies
 import json
 from DaiDi_Discord import Dai_Di, Player
+from DaiDi_Tables import TableManager
+from DaiDi_Roles import RoleCache, role_names
+from DaiDi_RatingStore import RatingStore
+from DaiDi_Render import hand_display, play_text, table_display
+from DaiDi_Outbox import Outbox, PROMPT, INFO
+from DaiDi_Parse import error_text, parse_cards
+from DaiDi_Cards import CARD_IDS, CARD_TUPLES
+from DaiDi_Elo import DEFAULT_RATING, card_cost, elo_update, recompute
+from DaiDi_GameBot import weakest
+from DaiDi_MCTS import ISMCTSBot
+import asyncio
 from numpy import inf
 from random import randint
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # Discord authentication details and server ids
 try:
@@ -26,22 +38,13 @@ except FileNotFoundError:
     with open('auth.txt', 'w') as json_file:
         json.dump(auth, json_file)
 
-try:
-    with open('elo.txt', 'r') as elo_file:
-        all_elo = json.load(elo_file)
-
-except FileNotFoundError:
-    '''
-    Entries are based on the discord id of players, so elo is not reset when changing names
-    '''
-    player_data = {'player_name': 10000}
-    with open('elo.txt', 'w') as elo_file:
-        json.dump(player_data, elo_file)
-    
-    with open('elo.txt', 'r') as elo_file:
-        all_elo = json.load(elo_file)
+# Skill ratings, stored in elo.db (see DaiDi_RatingStore)
+# Entries are based on the discord id of players, so elo is not reset when changing names
+# Ratings from an old elo.txt file are imported the first time
+all_elo = RatingStore('elo.db', legacy_path='elo.txt')
 
-# Discord channels where game is played/tested
+# Discord channels where games are played/tested
+# Add more channel ids to host more tables
 discord_channels = {'game_channel': channel ids here,'test_channel': channel ids here}
 
 
@@ -50,9 +53,30 @@ discord_channels = {'game_channel': channel ids here,'test_channel': channel ids
 # Is case sensitive
 admin_tier = {'Admin',}
 
-# Game object and misc details
-Game = {'game': Dai_Di(), 'ongoing': (False, False), 'order': [], 'turn': 0}
-delimiter_string = '\_' * 20
+# Role names of server members, kept for 10 minutes
+role_cache = RoleCache(ttl=600)
+
+# Thread pool for the CPU-bound game work (balancing and dealing hands)
+game_executor = ThreadPoolExecutor(max_workers=4)
+
+# Worker processes for the moves of bot seats
+# Searching holds the GIL, in threads it would hold up the event loop as well as dealing and saving ratings
+# The bot and the game are copied to the worker for every move
+bot_executor = ProcessPoolExecutor(max_workers=4)
+
+# Bots that can fill empty seats with !addbot, keyed by name
+# Each seat gets its own play function (see DaiDi_GameBot), the first bot is used when no name is given
+bot_seats = {'ismcts': lambda: ISMCTSBot(iterations=5000, time_limit=2),
+             'weakest': lambda: weakest}
+
+# Seconds a bot seat has to choose a move, then it plays its weakest hand
+bot_move_time = 5
+
+# Game tables, one per discord channel in discord_channels
+tables = TableManager(discord_channels.values())
+
+# Replies are queued and sent within the rate limits by the outbox task (see DaiDi_Outbox)
+outbox = Outbox()
 
 # Bot code body
 import discord
@@ -62,505 +86,708 @@ client = discord.Client()
 # Checks if bot is ready
 @client.event
 async def on_ready():
+    global flush_task, outbox_task
+    if flush_task is None:
+        flush_task = client.loop.create_task(flush_ratings())
+    if outbox_task is None:
+        outbox_task = client.loop.create_task(outbox.run())
     print('All clear')
 
 
+outbox_task = None
+
+
+# Results of the games that ended during !rerate, None when no rerate is running
+rerate_games = None
+
+# Set by !stop, commands are ignored from then on
+stopping = False
+
+
+# Writes changed ratings to elo.db every 30 seconds, off the event loop
+flush_task = None
+
+async def flush_ratings():
+    while True:
+        await asyncio.sleep(30)
+        await client.loop.run_in_executor(game_executor, all_elo.flush)
+
+
+# Keeps the cached roles up to date
+@client.event
+async def on_member_update(before, after):
+    if after.guild.id == auth['server_id']:
+        role_cache.set(after.id, role_names(after))
+
+
+@client.event
+async def on_member_remove(member):
+    if member.guild.id == auth['server_id']:
+        role_cache.remove(member.id)
+
+
 @client.event
 async def on_message(message):
-    global Game, all_elo
-    
+    global rerate_games, stopping
+
+    # Non-command messages are dropped before any other work
+    if not message.content.startswith('!') or message.author == client.user: # Bot does not reply to itself
+        return
+
+    if stopping:
+        return
+
+    # The command is the text before the first space or semicolon
+    name = message.content.split(';', 1)[0].split(maxsplit=1)[0].lower()
+
     # Command to force logout the bot
     # Only users with tiernames in admin_tier set can use this command
-    if message.content.lower() == '!stop' and list(admin_tier & Tier(message.author)): 
-        
-        with open('elo.txt', 'w') as outfile:
-            json.dump(all_elo, outfile)
-        
-        await message.channel.send('I go to sleep now :sleepy:')
-        await client.logout()
-    
-    # Checks if message is in the appropriate discord channels
-    if message.channel == client.get_channel(discord_channels['game_channel']) or message.channel == client.get_channel(discord_channels['test_channel']):
-        if message.author == client.user: # Bot does not reply to itself
-            return
-        
-        # Bot ignores vociferously verbose verbiage
-        if len(message.content) > 100:
-            return
-        
-        # Gets the tier of the user.
-        tier = Tier(message.author)
-        
-        if message.content.lower().startswith() == '!gamesetup': # Setting up game
-            
-            # Cannot setup game if game is already setup and game is ongoing
-            if Game['ongoing'] == (False, False):
-
-                await message.channel.send('Loading game: Dai Di')
-                Game['game'] = Dai_Di() # Sets up game
-                Game['ongoing'] = (True, False) # Sets ongoing_game to true
-                Game['order'] = [] # Sets up player order
-                Game['turn'] = 0 # Sets game turn to 0
-                
-                # Shuffles deck
-                Game['game'].shuffle_deck()
-                
-                await message.channel.send('Game loaded')
-                await message.channel.send('Player lobby is open')
-                return
-            
-            # Allows admins to reset the game and set up a new game
-            # Can be done at any point, even during games
-            # Try not to be a jerk
-            elif (Game['ongoing'][0] ==  True and
-                  list(admin_tier & tier)):
-                
-                await message.channel.send('Restarting game')
-                Game['game'] = Dai_Di()
-                Game['ongoing'] = (True, False)
-                Game['order'] = []
-                Game['turn'] = 0
-                return
-            
-            # Non admin users cannot start new games
-            else:
-                await message.channel.send('There is a game in progress')
-                return
-        
-        # Message to join game, the semicolon is necessary
-        # Format is `!joingame; nickname`
-        elif message.content.lower().startswith('!joingame'):
-            if Game['ongoing'][0] == False:
-                await message.channel.send('The game lobby has not opened')
-                return
-        
-            discord_name = message.author
-            discord_id = message.author.id
-            nickname = ' '.join(message.content.split(';')[1:])
-            
-            elo_check = has_elo(discord_id, all_elo)
-            
-            # If the semicolon is left out user will be mocked
-            if message.content.find(':') is None or nickname == '':
-                if randint(0,999) == 0:
-                    nickname = str(message.author)[:-5] + " can't follow instructions"
-                else:
-                    nickname = str(message.author)[:-5] + ' forgot about the semicolon'
-
-            player_names = [player.discord_name for player in Game['game'].players]
-            
-            # Game can only be played by 4 people exactly
-            if len(player_names) >= 4:
-                await message.channel.send('The game is full')
-                return
-            
-            # Players must be unique users
-            if discord_name in player_names:
-                await message.channel.send('You are already in the game')
+    # Ratings are saved once no table can end a game any more
+    if name == '!stop':
+        if list(admin_tier & Tier(message.author)):
+            if rerate_games is not None:
+                outbox.post(message.channel, 'The ratings are being recomputed, try again when they are done')
                 return
 
-            # Adds players to game object and returns status text
-            Game['game'].players.append(Player(f'{nickname}', f'{discord_name}', discord_id))
-            await message.channel.send(f'{nickname} joined the game\n{nickname} {elo_check[1]}\n{nickname} has a rating of {elo_check[0]}')
-            return
-        
-        # Message to start game
-        elif message.content.lower().startswith('!startgame'):
-            # Can't start a game with less than 4 players
-            if len(Game['game'].players) < 4:
-                await message.channel.send('You need 4 players to play')
-                return
-            
-            # Checks if there is an available game
-            elif Game['ongoing'][0] == False:
-                await message.channel.send('You need to setup a game first')
-            
-            # Checks if there is an ongoing game
-            elif Game['ongoing'][1] == True:
-                await message.channel.send('There is an ongoing game')
+            stopping = True
+
+            # Commands that are running finish first, the locks are never released
+            for table in list(tables.tables.values()):
+                await table['lock'].acquire()
+
+            if flush_task is not None:
+                flush_task.cancel()
+                try:
+                    await flush_task
+                except asyncio.CancelledError:
+                    pass
+
+            await client.loop.run_in_executor(game_executor, all_elo.close)
+            bot_executor.shutdown(wait=False, cancel_futures=True)
+
+            outbox.post(message.channel, 'I go to sleep now :sleepy:')
+            await outbox.drain()
+            await client.logout()
+        return
+
+    # Command to recompute every rating from the recorded games, e.g. after changing the rating rules
+    # Only users with tiernames in admin_tier set can use this command
+    if name == '!rerate':
+        if list(admin_tier & Tier(message.author)):
+            if rerate_games is not None:
+                outbox.post(message.channel, 'The ratings are already being recomputed')
                 return
-            
-            # Balances hand
-            # The shuffle_deck function already checks for unbalanced number of 2's
-            # Average player hand should have a strength of 800 (799.5)
-            # Uses a player strength range of 650 (-150) to 900 (+100)
-            # Range is completely arbitrary, feel free to change values or remove altogether
-            balance_message = await message.channel.send('Balancing hands')
-            player_strengths = [sum(map(Game['game'].card_value, Game['game'].deck_list[i::4])) for i in range(4)]
-
-            # Hand is reshuffled until all hands strength are within the set range
-            while min(player_strengths) < 650 or max(player_strengths) > 900:
-                Game['game'].shuffle_deck()
-                player_strengths = [sum(map(Game['game'].card_value, Game['game'].deck_list[i::4])) for i in range(4)]
-            
-            
-            await balance_message.edit(content='Balancing hands.')
-            await balance_message.edit(content='Balancing hands..')
-            await balance_message.edit(content='Balancing hands...')
-            await balance_message.edit(content='Hands balanced')
-            
-            # Sets game status to ongoing, deals out cards and finds the starting player (player with diamond 3 card)
-            Game['ongoing'] = (True, True)
-            Game['game'].deal_cards()
-            starter_player = Game['game'].starting_player()
-            print(starter_player)
-
-            play_order = (Game['game'].players[starter_player:] +
-                          Game['game'].players[:starter_player])
-            
-            Game['order'] = play_order
-            
-            # Setting up player hand display
-            # _suit_sorted displays the cards sorted by suits (left to right, diamond, clubs, hearts, spades)
-            # The suit sorted cards are displayed in the same line to avoid revealing information on a player's hand
-            player1_suit_sorted = play_order[0].diamonds + play_order[0].clubs + play_order[0].hearts + play_order[0].spades
-            
-            player1_hands_suit = f'{play_order[0].nickname}\'s Hand\nBy suits:\n||{player1_suit_sorted}||\n'
-            player1_hands_normal = f'By value:\n||{play_order[0].hand}||\n{delimiter_string}'
-            player1_all_hand = player1_hands_suit + player1_hands_normal
-            
-            player2_suit_sorted = play_order[1].diamonds + play_order[1].clubs + play_order[1].hearts + play_order[1].spades
-            
-            player2_hands_suit = f'{play_order[1].nickname}\'s Hand\nBy suits:\n||{player2_suit_sorted}||\n'
-            player2_hands_normal = f'By value:\n||{play_order[1].hand}||\n{delimiter_string}'
-            player2_all_hand = player2_hands_suit + player2_hands_normal
-
-
-            player3_suit_sorted = play_order[2].diamonds + play_order[2].clubs + play_order[2].hearts + play_order[2].spades
-            
-            player3_hands_suit = f'{play_order[2].nickname}\'s Hand\nBy suits:\n||{player3_suit_sorted}||\n'
-            player3_hands_normal = f'By value:\n||{play_order[2].hand}||\n{delimiter_string}'
-            player3_all_hand = player3_hands_suit + player3_hands_normal
 
+            # Games that end during the rerate are held back by end_game and rated afterwards
+            rerate_games = []
+            try:
+                games_count = await client.loop.run_in_executor(game_executor, rerate_history)
+            finally:
+                held_games, rerate_games = rerate_games, None
+                for channel, players, winner in held_games:
+                    outbox.post(channel, rating_changes(players, winner))
+
+            outbox.post(message.channel, f'Recomputed the ratings of {games_count + len(held_games)} games')
+        return
+
+    handler = commands.get(name)
+    if handler is None:
+        return
+
+    # Checks if message is in one of the table channels
+    Game = tables.get(message.channel.id)
+    if Game is None:
+        return
     
-            player4_suit_sorted = play_order[3].diamonds + play_order[3].clubs + play_order[3].hearts + play_order[3].spades
-            
-            player4_hands_suit = f'{play_order[3].nickname}\'s Hand\nBy suits:\n||{player4_suit_sorted}||\n'
-            player4_hands_normal = f'By value:\n||{play_order[3].hand}||\n{delimiter_string}'
-            player4_all_hand = player4_hands_suit + player4_hands_normal
-            
-            await message.channel.send(f'The player order is {play_order[0].nickname}, {play_order[1].nickname}, {play_order[2].nickname}, {play_order[3].nickname}')
-
-            await message.channel.send(player1_all_hand)
-            await message.channel.send(player2_all_hand)
-            await message.channel.send(player3_all_hand)
-            await message.channel.send(player4_all_hand)
-            await message.channel.send('No peeking :angry:')
-            return
-        
-        # Message to play cards
-        # Format is !playcard; card1, card2, card3, card4, card5
-        # Again, semicolon and comma are necessary
-        # Can can only be played when game is ongoing
-        # Card format should be: suits, number
-        # Number must be a number, don't type the number as words
-        elif (message.content.lower().startswith('!playcard') and
-              Game['ongoing'][1] == True):
-
-            string = message.content.lower().split(';')
-            cards = string[1]
-            
-            # Gets current game turn and current player
-            game_turn = Game['turn']
-            current_player = Game['order'][game_turn]
-            
-            # Checks if it is the message author's turn
-            if str(message.author) != str(current_player.discord_name):
-                await message.channel.send(f'It is{current_player.nickname}\'s turn')
-                return
-            
-            # Converts text to cards for processing
-            real_cards = text_to_cards(cards)
-            print(real_cards)
-            
-            # Checks if cards form a valid hand and if player can play them
-            game_success = Game['game'].can_play(current_player, real_cards)
-            player_success = current_player.can_play(real_cards)
-
-            if game_success[0] == False:
-                await message.channel.send(f'{game_success[1]}')
-                return
-            
-            elif player_success[0] == False:
-                await message.channel.send(f'{player_success[1]}')
-                return
-            
-            else:
-                # Plays card and status text
-                current_player.play_card(real_cards)
-                print(f'text_to_cards: {real_cards}\ncurrent player: {current_player.nickname}\ntype of hand: {game_success[1]}')
-
-                # Checks if player has any cards left in hand
-                cards_left = len(current_player.hand)
-                Game['turn'] = (Game['turn'] + 1) % 4
-
-                # End of game
-                # Announces winner, changes elo
-                if cards_left == 0:
-                    Game['ongoing'] = (False, False)
-                    elo_string = ''
-                    
-                    for player in Game['game'].players:
-                        if player.discord_id == message.author.id:
-                            if all_elo[str(player.discord_id)] == float(inf):
-                                elo_string += f'{player.nickname} is still a god :sunglasses:\n'
-                            
-                            else:
-                                all_elo[str(player.discord_id)] = int(all_elo[str(player.discord_id)] * 1.2)
-                                elo_string += f'{player.nickname} raised their elo to {all_elo[str(player.discord_id)]}\n'
-
-                        else:
-                            if all_elo[str(player.discord_id)] == float(inf):
-                                elo_string += f'{player.nickname} was taking it easy :sunglasses:\n'
-
-                            elif all_elo[str(player.discord_id)] <= 5:
-                                all_elo[str(player.discord_id)] = 5
-                                elo_string += f'{player.nickname}\'s elo is too small to change :cry:\n'
-
-                            else:
-                                all_elo[str(player.discord_id)] = int(all_elo[str(player.discord_id)] * 0.85)
-                                elo_string += f'{player.nickname}\'s elo dropped to {all_elo[str(player.discord_id)]}\n'
-                    
-                    with open('elo.txt', 'w') as outfile:
-                        json.dump(all_elo, outfile)
-                    
-                    await message.channel.send(f'{game_success[1]}\n{current_player.nickname} has won!\n{elo_string}')
-                    return
-               
-                # Not end of game
-                else:
-                    new_current = Game['order'][(game_turn + 1) % 4]
-                    await message.channel.send(f'{game_success[1]}\n{new_current.nickname} turn now')
-                    return
-
-            # Displays cards every four turns
-            if Game['turn'] == 0:
-                play_order = Game['order']
-                
-                player1_suit_sorted = play_order[0].diamonds + play_order[0].clubs + play_order[0].hearts + play_order[0].spades
-                
-                player1_hands_suit = f'{play_order[0].nickname}\'s Hand\nBy suits:\n||{player1_suit_sorted}||\n'
-                player1_hands_normal = f'By value:\n||{play_order[0].hand}||\n{delimiter_string}'
-                player1_all_hand = player1_hands_suit + player1_hands_normal
-                
-                player2_suit_sorted = play_order[1].diamonds + play_order[1].clubs + play_order[1].hearts + play_order[1].spades
-                
-                player2_hands_suit = f'{play_order[1].nickname}\'s Hand\nBy suits:\n||{player2_suit_sorted}||\n'
-                player2_hands_normal = f'By value:\n||{play_order[1].hand}||\n{delimiter_string}'
-                player2_all_hand = player2_hands_suit + player2_hands_normal
-                
-                player3_suit_sorted = play_order[2].diamonds + play_order[2].clubs + play_order[2].hearts + play_order[2].spades
-                
-                player3_hands_suit = f'{play_order[2].nickname}\'s Hand\nBy suits:\n||{player3_suit_sorted}||\n'
-                player3_hands_normal = f'By value:\n||{play_order[2].hand}||\n{delimiter_string}'
-                player3_all_hand = player3_hands_suit + player3_hands_normal
-                
-                player4_suit_sorted = play_order[3].diamonds + play_order[3].clubs + play_order[3].hearts + play_order[3].spades
-                
-                player4_hands_suit = f'{play_order[3].nickname}\'s Hand\nBy suits:\n||{player4_suit_sorted}||\n'
-                player4_hands_normal = f'By value:\n||{play_order[3].hand}||\n{delimiter_string}'
-                player4_all_hand = player4_hands_suit + player4_hands_normal
-                
-                await message.channel.send(f'The player order is {play_order[0].nickname}, {play_order[1].nickname}, {play_order[2].nickname}, {play_order[3].nickname}')
-
-                await message.channel.send(player1_all_hand)
-                await message.channel.send(player2_all_hand)
-                await message.channel.send(player3_all_hand)
-                await message.channel.send(player4_all_hand)
-                return
-                
-        # Message to pass on turn, only works when game is setup and ongoing
-        elif (message.content == '!pass' and Game['ongoing'] == (True, True)):
-            
-            # Cannot pass at the start of game
-            if len(Game['game'].play_area) == 0:
-                await message.channel.send('You cannot pass, you must play a card to start')
-                return
-            
-            game_turn = Game['turn']
-            current_player = Game['order'][game_turn]
-            last_player = Game['game'].play_area[-1][1]
-            
-            # Cannot pass if everyone else has passed and you played the last hand
-            if current_player.nickname == last_player:
-                await message.channel.send('You cannot pass, you must play a card')
-                return
-            
-            # It's not your turn
-            if str(message.author) != str(current_player.discord_name):
-                await message.channel.send(f'It is{current_player.nickname}\'s turn')
-                return
-            
-            # Status message and increments turn
-            Game['game'].can_play(current_player, [], skip_turn=True)
-            Game['turn'] = (Game['turn'] + 1) % 4
-            
-            await message.channel.send(f'{current_player.nickname} has passed')
-            return
-            
-        # Message to show the last played hands if possible
-        # Displays player nickname next to hand played
-        elif message.content == '!lasthands':
-            num_of_hands = min(len(Game['game'].play_area), 5)
-            last_five_hands = [(cards[1], cards[0]) for cards in Game['game'].play_area[-num_of_hands:]]
+    # Bot ignores vociferously verbose verbiage
+    if len(message.content) > 100:
+        return
+
+    # Commands of a table are handled one at a time, other tables carry on
+    async with Game['lock']:
+        await handler(message, Game)
+
+
+# Table commands keyed by command name
+# Handlers are called with the message and the table of the channel
+commands = {}
+
+# Decorator to register a table command
+def command(name):
+    def register(handler):
+        commands[name] = handler
+        return handler
+    return register
+
+
+# Message to set up a game
+@command('!gamesetup')
+async def gamesetup(message, Game):
+    # Gets the tier of the user.
+    tier = Tier(message.author)
+
+    # Cannot setup game if game is already setup and game is ongoing
+    if Game['ongoing'] == (False, False):
+
+        outbox.post(message.channel, 'Loading game: Dai Di')
+        Game['game'] = Dai_Di() # Sets up game
+        print(f"Game seed: {Game['game'].seed}") # Seed to replay the deal
+        Game['ongoing'] = (True, False) # Sets ongoing_game to true
+        Game['order'] = [] # Sets up player order
+        Game['turn'] = 0 # Sets game turn to 0
+        Game['bots'] = {} # Removes the bot seats
+        Game['thinking'] = {}
+
+        # Shuffles deck
+        Game['game'].shuffle_deck()
+
+        outbox.post(message.channel, 'Game loaded')
+        outbox.post(message.channel, 'Player lobby is open')
+        return
+
+    # Allows admins to reset the game and set up a new game
+    # Can be done at any point, even during games
+    # Try not to be a jerk
+    elif (Game['ongoing'][0] ==  True and
+          list(admin_tier & tier)):
+
+        outbox.post(message.channel, 'Restarting game')
+        Game['game'] = Dai_Di()
+        print(f"Game seed: {Game['game'].seed}")
+        Game['ongoing'] = (True, False)
+        Game['order'] = []
+        Game['turn'] = 0
+        Game['bots'] = {}
+        Game['thinking'] = {}
+        return
+
+    # Non admin users cannot start new games
+    else:
+        outbox.post(message.channel, 'There is a game in progress')
+        return
+
+
+# Message to join game, the semicolon is necessary
+# Format is `!joingame; nickname`
+@command('!joingame')
+async def joingame(message, Game):
+    if Game['ongoing'][0] == False:
+        outbox.post(message.channel, 'The game lobby has not opened')
+        return
+
+    discord_name = message.author
+    discord_id = message.author.id
+    nickname = ' '.join(message.content.split(';')[1:])
+
+    elo_check = has_elo(discord_id, all_elo)
+
+    # If the semicolon is left out user will be mocked
+    if message.content.find(':') is None or nickname == '':
+        if randint(0,999) == 0:
+            nickname = str(message.author)[:-5] + " can't follow instructions"
+        else:
+            nickname = str(message.author)[:-5] + ' forgot about the semicolon'
+
+    player_names = [player.discord_name for player in Game['game'].players]
+
+    # Game can only be played by 4 people exactly
+    if len(player_names) >= 4:
+        outbox.post(message.channel, 'The game is full')
+        return
+
+    # Players must be unique users
+    if discord_name in player_names:
+        outbox.post(message.channel, 'You are already in the game')
+        return
+
+    # Adds players to game object and returns status text
+    Game['game'].players.append(Player(f'{nickname}', f'{discord_name}', discord_id))
+    outbox.post(message.channel, f'{nickname} joined the game\n{nickname} {elo_check[1]}\n{nickname} has a rating of {elo_check[0]}')
+    return
+
+
+# Message to fill a seat with a bot
+# Format is `!addbot` or `!addbot; name` with a name from bot_seats
+@command('!addbot')
+async def addbot(message, Game):
+    if Game['ongoing'] != (True, False):
+        outbox.post(message.channel, 'The game lobby has not opened')
+        return
+
+    if len(Game['game'].players) >= 4:
+        outbox.post(message.channel, 'The game is full')
+        return
+
+    if ';' in message.content:
+        bot_name = message.content.split(';', 1)[1].strip().lower()
+    else:
+        bot_name = message.content.partition(' ')[2].strip().lower()
+    bot_name = bot_name or next(iter(bot_seats))
+
+    if bot_name not in bot_seats:
+        outbox.post(message.channel, f'There is no bot called {bot_name}\nBots: {", ".join(bot_seats)}')
+        return
+
+    # Bots have negative discord ids, so they never share an id with a discord user
+    bot_id = -(len(Game['bots']) + 1)
+    nickname = f' {bot_name} bot {-bot_id}'
+    Game['bots'][bot_id] = bot_seats[bot_name]()
+    Game['game'].players.append(Player(nickname, nickname.strip(), bot_id))
+
+    outbox.post(message.channel, f'{nickname} joined the game\n{nickname} is a bot and is not rated')
+    return
+
+
+# Message to start game
+@command('!startgame')
+async def startgame(message, Game):
+    # Can't start a game with less than 4 players
+    if len(Game['game'].players) < 4:
+        outbox.post(message.channel, 'You need 4 players to play')
+        return
+
+    # Checks if there is an available game
+    elif Game['ongoing'][0] == False:
+        outbox.post(message.channel, 'You need to setup a game first')
+        return
+
+    # Checks if there is an ongoing game
+    elif Game['ongoing'][1] == True:
+        outbox.post(message.channel, 'There is an ongoing game')
+        return
+
+    # Bots only fill in for missing players
+    elif len(Game['bots']) >= 4:
+        outbox.post(message.channel, 'You need at least 1 human player to play')
+        return
+
+    # Balances hand
+    # The shuffle_deck function already checks for unbalanced number of 2's
+    # Average player hand should have a strength of 800 (799.5)
+    # Uses a player strength range of 650 (-150) to 900 (+100)
+    # Range is completely arbitrary, feel free to change values or remove altogether
+    # Balancing, dealing and formatting the hands run in game_executor so other channels are not blocked
+    play_order, hand_strings = await client.loop.run_in_executor(game_executor, start_game, Game['game'])
+
+    # Sets game status to ongoing
+    Game['ongoing'] = (True, True)
+    Game['order'] = play_order
+
+    # The whole table is sent in as few messages as possible
+    outbox.post_blocks(message.channel, ['Hands balanced'] + table_display(play_order, hands=hand_strings) +
+                       ['No peeking :angry:'])
+
+    # A bot with the Diamond 3 starts right away
+    await play_bots(message.channel, Game)
+    return
+
+
+# Message to play cards
+# Format is !playcard; card1, card2, card3, card4, card5
+# Cards can be typed as D K, dk, kd, 10h, diamond king, king of diamonds or K:diamonds: (see DaiDi_Parse)
+@command('!playcard')
+async def playcard(message, Game):
+    # Can can only be played when game is ongoing
+    if Game['ongoing'][1] != True:
+        return
+
+    # Everything after the command is card text, the semicolon is optional
+    if ';' in message.content:
+        cards = message.content.split(';', 1)[1]
+    else:
+        cards = message.content.partition(' ')[2]
+
+    # Gets current game turn and current player
+    game_turn = Game['turn']
+    current_player = Game['order'][game_turn]
+
+    # Checks if it is the message author's turn
+    if str(message.author) != str(current_player.discord_name):
+        outbox.post(message.channel, f'It is{current_player.nickname}\'s turn', PROMPT)
+        return
+
+    # Converts text to cards for processing
+    card_list, errors = parse_cards(cards)
+    if errors:
+        outbox.post(message.channel, error_text(errors))
+        return
+
+    real_cards = [CARD_TUPLES[card] for card in card_list]
+    print(real_cards)
+
+    # Checks if cards form a valid hand and if player can play them
+    game_success = Game['game'].can_play(current_player, real_cards)
+    player_success = current_player.can_play(real_cards)
+
+    if game_success[0] == False:
+        outbox.post(message.channel, f'{game_success[1]}')
+        return
+
+    elif player_success[0] == False:
+        outbox.post(message.channel, f'{player_success[1]}')
+        return
+
+    else:
+        play_hand(message.channel, Game, current_player, real_cards, game_success[1])
+        await play_bots(message.channel, Game)
+        return
+
 
-            last_five_str = '\n\n'.join([hand for hand in last_five_hands])
+# Message to pass on turn
+@command('!pass')
+async def pass_turn(message, Game):
+    # Only works when game is setup and ongoing
+    if Game['ongoing'] != (True, True):
+        return
 
-            await message.channel.send(f'The last hands are:\n\n{last_five_str}')
+    # Cannot pass at the start of game
+    if len(Game['game'].play_area) == 0:
+        outbox.post(message.channel, 'You cannot pass, you must play a card to start')
+        return
+
+    game_turn = Game['turn']
+    current_player = Game['order'][game_turn]
+    last_player = Game['game'].play_area[-1][1]
+
+    # Cannot pass if everyone else has passed and you played the last hand
+    if current_player.nickname == last_player:
+        outbox.post(message.channel, 'You cannot pass, you must play a card')
+        return
+
+    # It's not your turn
+    if str(message.author) != str(current_player.discord_name):
+        outbox.post(message.channel, f'It is{current_player.nickname}\'s turn', PROMPT)
+        return
+
+    Game['game'].can_play(current_player, [], skip_turn=True)
+    pass_hand(message.channel, Game, current_player)
+    await play_bots(message.channel, Game)
+    return
+
+
+# Message to show the last played hands if possible
+# Displays player nickname next to hand played
+@command('!lasthands')
+async def lasthands(message, Game):
+    num_of_hands = min(len(Game['game'].play_area), 5)
+    if num_of_hands == 0:
+        outbox.post(message.channel, 'No hands have been played yet', INFO)
+        return
+
+    last_five_str = '\n\n'.join(play_text(play) for play in Game['game'].play_area[-num_of_hands:])
+
+    outbox.post(message.channel, f'The last hands are:\n\n{last_five_str}', INFO)
+    return
+
+
+# Displays all players hands
+@command('!checkhands')
+async def checkhands(message, Game):
+    # Only works when a game is ongoing
+    if Game['ongoing'] != (True, True):
+        return
+
+    play_order = Game['order']
+    current_player = play_order[Game['turn']]
+    blocks = table_display(play_order, status=f'It is{current_player.nickname}\'s turn')
+
+    if Game['game'].play_area:
+        blocks.append(f'Last played hand is:\n{play_text(Game["game"].play_area[-1])}')
+
+    outbox.post_blocks(message.channel, blocks)
+    return
+
+
+# Message to check skill rating
+@command('!checkskill')
+async def checkskill(message, Game):
+    player_id = message.author.id
+
+    if str(player_id) in all_elo:
+        if all_elo[str(player_id)] == float('inf'):
+            outbox.post(message.channel, 'You have a rating of :infinity::sunglasses:', INFO)
             return
 
-        # Displays all players hands
-        elif message.content == '!checkhands':
-            play_order = Game['order']
-            game_turn = Game['turn']
-            current_player = Game['order'][game_turn]
-
-            
-            player1_suit_sorted = play_order[0].diamonds + play_order[0].clubs + play_order[0].hearts + play_order[0].spades
-            
-            player1_hands_suit = f'{play_order[0].nickname}\'s Hand\nBy suits:\n||{player1_suit_sorted}||\n'
-            player1_hands_normal = f'By value:\n||{play_order[0].hand}||\n{delimiter_string}'
-            player1_all_hand = player1_hands_suit + player1_hands_normal
-
-            
-            player2_suit_sorted = play_order[1].diamonds + play_order[1].clubs + play_order[1].hearts + play_order[1].spades
-            
-            player2_hands_suit = f'{play_order[1].nickname}\'s Hand\nBy suits:\n||{player2_suit_sorted}||\n'
-            player2_hands_normal = f'By value:\n||{play_order[1].hand}||\n{delimiter_string}'
-            player2_all_hand = player2_hands_suit + player2_hands_normal
-
-            
-            player3_suit_sorted = play_order[2].diamonds + play_order[2].clubs + play_order[2].hearts + play_order[2].spades
-            
-            player3_hands_suit = f'{play_order[2].nickname}\'s Hand\nBy suits:\n||{player3_suit_sorted}||\n'
-            player3_hands_normal = f'By value:\n||{play_order[2].hand}||\n{delimiter_string}'
-            player3_all_hand = player3_hands_suit + player3_hands_normal
-
-            
-            player4_suit_sorted = play_order[3].diamonds + play_order[3].clubs + play_order[3].hearts + play_order[3].spades
-            
-            player4_hands_suit = f'{play_order[3].nickname}\'s Hand\nBy suits:\n||{player4_suit_sorted}||\n'
-            player4_hands_normal = f'By value:\n||{play_order[3].hand}||\n{delimiter_string}'
-            player4_all_hand = player4_hands_suit + player4_hands_normal
-            
-            last_hand = (Game['game'].play_area[-1][1], Game['game'].play_area[-1][0])
-            
-            await message.channel.send(f'The player order is {play_order[0].nickname}, {play_order[1].nickname}, {play_order[2].nickname}, {play_order[3].nickname}\nIt is{current_player.nickname}\'s turn')
-
-            await message.channel.send(player1_all_hand)
-            await message.channel.send(player2_all_hand)
-            await message.channel.send(player3_all_hand)
-            await message.channel.send(player4_all_hand)
-            await message.channel.send(f'Last played hand is:\n{last_hand}')
+        else:
+            outbox.post(message.channel, f'You have a rating of {all_elo[str(player_id)]}', INFO)
             return
-        
-        # Message to check skill rating
-        elif message.content.startswith('!checkskill'):
-            player_id = message.author.id
-            
-            if str(player_id) in all_elo.keys():
-                if all_elo[str(player_id)] == float('inf'):
-                    await message.channel.send('You have a rating of :infinity::sunglasses:')
-                    return
-                
-                else:
-                    await message.channel.send(f'You have a rating of {all_elo[str(player_id)]}')
-                    return
-            
+
+    else:
+        outbox.post(message.channel, 'You don\'t have a rating\nJoin a game to get started', INFO)
+        return
+
+
+# Message to show the players with the highest ratings, !top or !top 20
+@command('!top')
+async def top(message, Game):
+    words = message.content.split()
+    count = int(words[1]) if len(words) > 1 and words[1].isdigit() else 10
+    entries = all_elo.leaderboard.top(min(max(count, 1), 25))
+
+    if not entries:
+        outbox.post(message.channel, 'Nobody has a rating yet\nJoin a game to get started', INFO)
+        return
+
+    lines = [f'{rank}. {member_name(user_id)}: {rating_text(rating)}' for rank, user_id, rating in entries]
+    outbox.post(message.channel, 'Leaderboard\n' + '\n'.join(lines), INFO)
+    return
+
+
+# Message to check rank and percentile on the leaderboard
+@command('!rank')
+async def rank(message, Game):
+    player_id = str(message.author.id)
+    player_rank = all_elo.leaderboard.rank(player_id)
+
+    if player_rank is None:
+        outbox.post(message.channel, 'You don\'t have a rating\nJoin a game to get started', INFO)
+        return
+
+    players = len(all_elo.leaderboard)
+    percentile = all_elo.leaderboard.percentile(player_id)
+    outbox.post(message.channel, f'You are ranked {player_rank} of {players} with a rating of {rating_text(all_elo[player_id])}\n'
+                                 f'Your rating is higher than {percentile:.0f}% of players', INFO)
+    return
+
+
+# Function to play the cards of the current player and post the result
+# The hand has already been checked and added to the play_area by Dai_Di.can_play, status is its text
+def play_hand(channel, Game, current_player, real_cards, status):
+    current_player.play_card(real_cards)
+    print(f'cards: {real_cards}\ncurrent player: {current_player.nickname}\ntype of hand: {status}')
+
+    # Checks if player has any cards left in hand
+    cards_left = current_player.card_count
+    Game['turn'] = (Game['turn'] + 1) % 4
+
+    # End of game
+    if cards_left == 0:
+        end_game(channel, Game, current_player, status)
+        return
+
+    # Not end of game
+    # Displays cards every four turns, in the same messages as the turn
+    outbox.post(channel, status)
+    post_turn(channel, Game)
+    if Game['turn'] == 0:
+        outbox.post_blocks(channel, table_display(Game['order']))
+
+
+# Function to pass the turn of the current player, the pass has already been checked by Dai_Di.can_play
+def pass_hand(channel, Game, current_player):
+    Game['turn'] = (Game['turn'] + 1) % 4
+    outbox.post(channel, f'{current_player.nickname} has passed')
+    post_turn(channel, Game)
+
+
+# Function to announce the next turn, bots play without being told
+def post_turn(channel, Game):
+    new_current = Game['order'][Game['turn']]
+    if new_current.discord_id not in Game['bots']:
+        outbox.post(channel, f'{new_current.nickname} turn now', PROMPT)
+
+
+# Function to end the game, announces the winner and changes elo
+# The human players are rated against each other from the cards left in their hands, bot seats are not rated
+def end_game(channel, Game, winner, status):
+    Game['ongoing'] = (False, False)
+    players = [player for player in Game['game'].players if player.discord_id not in Game['bots']]
+
+    # A single player has nobody to be rated against
+    if len(players) < 2:
+        outbox.post(channel, f'{status}\n{winner.nickname} has won!')
+        return
+
+    # !rerate replaces every rating, games that end while it runs are rated once it is done
+    if rerate_games is not None:
+        rerate_games.append((channel, players, winner))
+        outbox.post(channel, f'{status}\n{winner.nickname} has won!\nThe new ratings follow once the ratings are recomputed')
+        return
+
+    # New ratings and the result are written to elo.db by flush_ratings
+    outbox.post(channel, f'{status}\n{winner.nickname} has won!\n{rating_changes(players, winner)}')
+
+
+# Function to rate the human players of a finished game and return the text of their new ratings
+def rating_changes(players, winner):
+    elo_string = ''
+    old_ratings, new_ratings = rate_game([str(player.discord_id) for player in players],
+                                         [card_cost(player.mask) for player in players])
+
+    for player, old, new in zip(players, old_ratings, new_ratings):
+        if player is winner:
+            if old == float(inf):
+                elo_string += f'{player.nickname} is still a god :sunglasses:\n'
+
             else:
-                await message.channel.send('You don\'t have a rating\nJoin a game to get started')
-                return
+                elo_string += f'{player.nickname} raised their elo to {new}\n'
+
+        else:
+            if old == float(inf):
+                elo_string += f'{player.nickname} was taking it easy :sunglasses:\n'
+
+            elif new < old:
+                elo_string += f'{player.nickname}\'s elo dropped to {new}\n'
 
-# Function to convert string to cards
-def text_to_cards(string):
-    # Text format is "Suit" + "Number
-    # E.g Diamond King, Spade Ace, Club Six
-    # It's not necessary to type out the entire card: D K, S 3 will be recognised
-    try:
-        try:
-            assert type(string) == str
-            
-        except AssertionError:
-            return 'Please input a string'
-        
-        true_cards = list(map(lambda x: x.split(), string.split(', ')))
-        true_cards = [card for singular in true_cards for card in singular]
-        length = len(true_cards)
-        
-        for i in range(length):
-            if true_cards[i] == '10':
-                continue
-            
             else:
-                true_cards[i] = true_cards[i][:1].upper()
-    
-        even = true_cards[::2]
-        odd = true_cards[1::2]
-        
+                elo_string += f'{player.nickname}\'s elo rose to {new}\n'
+
+    return elo_string
+
+
+# Plays the turns of the bot seats until it is a human player's turn or the game ends
+# Moves are chosen in bot_executor so other tables and commands carry on, a bot that takes longer than bot_move_time
+# or chooses a move it cannot play plays its weakest hand instead
+# A bot that ran out of time may still be choosing its last move in Game['thinking'],
+# it is not asked again until it is done so a seat never holds more than one worker
+async def play_bots(channel, Game):
+    while Game['ongoing'] == (True, True):
+        current_player = Game['order'][Game['turn']]
+        play_function = Game['bots'].get(current_player.discord_id)
+        if play_function is None:
+            return
+
+        play_area = list(Game['game'].play_area)
+        thinking = Game['thinking'].get(current_player.discord_id)
         try:
-            assert len(even) == len(odd)
-            
-        except AssertionError:
-            return 'Please enter cards correctly'
-            
-        return list(zip(even, odd))
-    
-    except IndexError:
-        return False
+            if thinking is not None and not thinking.done():
+                raise asyncio.TimeoutError
 
+            thinking = client.loop.run_in_executor(bot_executor, play_function, current_player, play_area)
+            Game['thinking'][current_player.discord_id] = thinking
 
-# Function to convert cards to a readable form
-def cards_to_text(lst):
-    # Text format is "Suit" + "Number
-    # E.g Diamond King, Spade Ace, Club Six
-    suits = ['D', 'C', 'H', 'S']
-    numbers = ['3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A', '2']
-    
-    full_suits = ['Diamond', 'Club', 'Heart', 'Spade']
-    full_numbers = ['3', '4', '5', '6', '7', '8', '9', '10', 'Jack', 'Queen', 'King', 'Ace', '2']
+            # The move is shielded so a timeout leaves it running and Game['thinking'] knows when it ends
+            action = await asyncio.wait_for(asyncio.shield(thinking), bot_move_time)
 
-    try:
-        card_string = []
-        length = len(lst)
-    
-        for i in range(length):
-            suit_string = full_suits[suits.index(lst[i][0])] # Matches suit index with full suit index
-            number_string = full_numbers[numbers.index(lst[i][1])] # Matches suit number with full number index
-            card_name = suit_string + ' ' + number_string
-            
-            card_string.append(card_name)
-    
-    except IndexError:
+        except asyncio.TimeoutError:
+            print(f'{current_player.nickname} ran out of time')
+            action = None
+
+        except Exception as error:
+            print(f'{current_player.nickname} failed to move: {error}')
+            action = None
+
+        if not bot_move(channel, Game, current_player, action):
+            bot_move(channel, Game, current_player, weakest(current_player, play_area))
+
+
+# Function to play the action of a bot, a list of cards or ['pass']
+# Returns False if the bot cannot play it
+def bot_move(channel, Game, current_player, action):
+    if action == ['pass']:
+        if not Game['game'].can_play(current_player, [], skip_turn=True)[0]:
+            return False
+
+        pass_hand(channel, Game, current_player)
+        return True
+
+    if not isinstance(action, list) or not action or not all(card in CARD_IDS for card in action):
         return False
-    
-    return card_string
+
+    # Checks the hand and that the bot holds the cards
+    game_success = Game['game'].can_play(current_player, action)
+    if game_success[0] == False:
+        return False
+
+    play_hand(channel, Game, current_player, action, game_success[1])
+    return True
+
+
+# Function to balance the hands, deal the cards and find the starting player (player with diamond 3 card)
+# Runs in game_executor, returns the play order and the hand display of each player
+def start_game(game):
+    # Cards are swapped between hands until all hands strength are within the set range
+    game.balance_deck(650, 900)
+    game.deal_cards()
+    starter_player = game.starting_player()
+    print(starter_player)
+
+    play_order = game.players[starter_player:] + game.players[:starter_player]
+    return (play_order, [hand_display(player) for player in play_order])
 
 
 # Function to return all the roles of a member
 # Is case sensitive
+# Roles are cached by user id (see DaiDi_Roles), the server is only asked on a miss
 def Tier(member):
+    tier = role_cache.get(member.id)
+    if tier is not None:
+        return tier
+
     server_member = server_user(member)
     if server_member is False:
         return 'Not in server'
     
     else:
-        tier = set(map(lambda x: x.name, server_member.roles))
-        tier.remove('@everyone')
+        tier = role_names(server_member)
+        role_cache.set(member.id, tier)
         return tier
 
 
 # Function to check a member is in the server
 def server_user(member):
-    server_members = client.get_guild(auth['server_id'])
+    server_member = client.get_guild(auth['server_id']).get_member(member.id)
     
-    if member in server_members.members:
-        return server_members.get_member(member.id)
+    if server_member is not None:
+        return server_member
     return False
 
 
+# Function to set the new ratings of the players of a game from their card costs
+# Infinite ratings are kept, the result is kept so the ratings can be recomputed with !rerate
+# Returns the ratings before and after the game
+def rate_game(user_ids, costs):
+    old_ratings = [all_elo.get(user_id, DEFAULT_RATING) for user_id in user_ids]
+    new_ratings = [(rating if rating == float(inf) else int(rating)) for rating in elo_update(old_ratings, costs).tolist()]
+
+    for user_id, new in zip(user_ids, new_ratings):
+        if new != float(inf):
+            all_elo[user_id] = new
+
+    all_elo.add_game(user_ids, costs)
+    return (old_ratings, new_ratings)
+
+
+# Recomputes every rating from the recorded games
+# Players start again from their rating imported from elo.txt or from the default rating
+# Infinite ratings and the ratings of players without recorded games are kept, returns the number of games
+def rerate_history():
+    games = all_elo.games()
+    baseline = all_elo.baseline()
+    played = {user_id for user_ids, costs in games for user_id in user_ids}
+
+    initial = {}
+    for user_id, rating in all_elo.items():
+        if rating == float('inf') or user_id not in played:
+            initial[user_id] = rating
+        else:
+            initial[user_id] = baseline.get(user_id, DEFAULT_RATING)
+
+    all_elo.replace_ratings(recompute(games, initial))
+    return len(games)
+
+
+# Function to return the text of a rating, infinite ratings are shown as an emoji
+def rating_text(rating):
+    if rating == float('inf'):
+        return ':infinity:'
+    return str(rating)
+
+
+# Function to return the server name of a user id, or the id if they left the server or it is not a discord id
+def member_name(user_id):
+    if not user_id.isdigit():
+        return user_id
+
+    server_member = client.get_guild(auth['server_id']).get_member(int(user_id))
+    if server_member is None:
+        return user_id
+    return server_member.display_name
+
+
 # Function to check and add person to skill pool
 def has_elo(user_id, dictionary):
-    if str(user_id) in dictionary.keys(): # Checks if user has an skill rating 
+    if str(user_id) in dictionary: # Checks if user has an skill rating 
         text_blurb = 'has some skill'
         
         if dictionary[str(user_id)] == float('inf'):
@@ -571,8 +798,10 @@ def has_elo(user_id, dictionary):
     
     else:
         text_blurb = 'has been added to the elo pool'
-        dictionary[str(user_id)] = 10000
-        return (10000, text_blurb)
+        dictionary[str(user_id)] = DEFAULT_RATING
+        return (DEFAULT_RATING, text_blurb)
 
 # Runs the bot
-client.run(auth['token'])
+# Worker processes that import this file do not run it
+if __name__ == '__main__':
+    client.run(auth['token'])
@@ -0,0 +1,67 @@
+'''
+Multi-player Elo ratings for Dai Di games
+
+A game of four players is scored as the six head to head games between every pair of players:
+the player with the lower card cost (value of the cards left in hand, 0 for the winner) wins, equal costs are a draw
+Every player's rating moves by k / 3 times the sum of their results minus their expected results,
+so the ratings of a game always add up to the same total
+
+Infinite ratings ("gods") are never changed and count as always expected to win
+Whole histories of games can be recomputed with recompute, e.g. after changing K_FACTOR
+'''
+
+import numpy as np
+from DaiDi_Cards import CARD_VALUES, mask_ids
+
+DEFAULT_RATING = 10000
+K_FACTOR = 64
+ELO_SCALE = 400
+
+
+# Returns the card cost of a hand mask, the sum of the values of its cards
+def card_cost(mask):
+    return sum(CARD_VALUES[card] for card in mask_ids(mask))
+
+
+# Returns the expected result of every player against every other player
+# ratings has the players on its last axis, the result has shape (..., players, players)
+def expected_scores(ratings, scale=ELO_SCALE):
+    ratings = np.asarray(ratings, dtype=float)
+    with np.errstate(invalid='ignore', over='ignore'):
+        expected = 1 / (1 + 10 ** ((ratings[..., None, :] - ratings[..., :, None]) / scale))
+
+    # Two infinite ratings are even
+    return np.nan_to_num(expected, nan=0.5)
+
+
+# Returns the result of every player against every other player from their card costs
+# 1 for a lower cost, 0.5 for the same cost and 0 for a higher cost
+def actual_scores(costs):
+    costs = np.asarray(costs, dtype=float)
+    lower = costs[..., :, None] < costs[..., None, :]
+    same = costs[..., :, None] == costs[..., None, :]
+    return lower + 0.5 * same
+
+
+# Returns the new ratings of the players of a game from their ratings and card costs
+# Takes arrays of shape (players,) or (games, players) to rate many independent games in one step
+def elo_update(ratings, costs, k=K_FACTOR, scale=ELO_SCALE):
+    ratings = np.asarray(ratings, dtype=float)
+    n_players = ratings.shape[-1]
+
+    # The diagonal compares players with themselves, 0.5 - 0.5 adds nothing
+    delta = k / (n_players - 1) * (actual_scores(costs) - expected_scores(ratings, scale)).sum(axis=-1)
+    return np.where(np.isfinite(ratings), np.rint(ratings + delta), ratings)
+
+
+# Replays a history of games, a list of (user ids, costs), oldest first
+# initial holds the ratings before the first game, players not in it start at default
+# Returns a dict of the final ratings of every player, whole ratings are ints
+def recompute(games, initial=None, default=DEFAULT_RATING, k=K_FACTOR, scale=ELO_SCALE):
+    ratings = dict(initial or {})
+
+    for user_ids, costs in games:
+        new_ratings = elo_update([ratings.get(user_id, default) for user_id in user_ids], costs, k, scale)
+        ratings.update(zip(user_ids, new_ratings.tolist()))
+
+    return {user_id: (int(rating) if np.isfinite(rating) else rating) for user_id, rating in ratings.items()}
@@ -0,0 +1,161 @@
+'''
+Exact solver for endgames with every hand known
+
+The solver searches the whole game tree from a GameState with alpha-beta pruning
+Four players do not fit alpha-beta as is, so the search is paranoid: the seat it solves for maximises
+its value and the other three players minimise it together
+The value of a position is what the seat is sure to get whatever the others play:
+with the WIN objective 1 if the seat can force a win and 0 otherwise,
+with the SCORE objective its GameState.scores at the end of the game
+WIN needs milliseconds for four cards each, SCORE can take seconds because losing lines are much longer
+
+Positions already searched are kept in a transposition table keyed by (state, seat) with the bound they gave,
+the table holds at most max_entries positions and evicts the least recently used ones
+
+Bots can hand the end of a game to the solver once every player holds few cards (see is_endgame),
+DaiDi_MCTS does so with its determinizations of the hidden hands
+'''
+
+from collections import OrderedDict
+from DaiDi_Cards import popcount
+from DaiDi_Hands import key_mask
+
+ENDGAME_CARDS = 4
+
+# Objectives
+WIN = 'win'
+SCORE = 'score'
+
+# Kinds of values in the transposition table
+EXACT = 0
+LOWER = 1 # the value is at least the stored value
+UPPER = 2 # the value is at most the stored value
+
+
+# Returns True if every player of a state holds at most cards cards
+def is_endgame(state, cards=ENDGAME_CARDS):
+    return all(popcount(hand) <= cards for hand in state.hands)
+
+
+class EndgameSolver:
+    def __init__(self, objective=WIN, max_entries=200000):
+        self.objective = objective
+        self.max_entries = max_entries
+        self.table = OrderedDict() # (state, seat): (value, kind, best move)
+        self.moves = {} # (hand, key to beat, first hand of the game): ordered moves
+        self.nodes = 0
+
+
+    # Returns the value of a finished game for seat
+    def terminal_value(self, state, seat):
+        if self.objective == WIN:
+            return 1.0 if state.hands[seat] == 0 else 0.0
+        return state.scores()[seat]
+
+
+    # Returns (best move, value) of the player to move, or of seat if given
+    # With a seat that is not to move, the move is the one the other players would play against seat
+    def solve(self, state, seat=None):
+        if seat is None:
+            seat = state.turn
+
+        if state.winner() is not None:
+            return (None, self.terminal_value(state, seat))
+
+        # Values are between 0 and 1, so the search window needs no margin
+        value = self.search(state, seat, 0.0, 1.0)
+        return (self.table[(state, seat)][2], value)
+
+
+    # Returns the value of every move of the player to move for seat (by default the player to move)
+    def move_values(self, state, seat=None):
+        if seat is None:
+            seat = state.turn
+        return {move: self.search(state.apply(move), seat, 0.0, 1.0) for move in state.moves()}
+
+
+    def store(self, key, entry):
+        self.table[key] = entry
+        self.table.move_to_end(key)
+        if len(self.table) > self.max_entries:
+            self.table.popitem(last=False)
+
+
+    # Returns the moves of a state, the best move of an earlier search first,
+    # then the hands with most cards and the strongest hands, passing last
+    # Hands come back often in a search, so the moves are kept by hand and key to beat
+    def ordered_moves(self, state, first=None):
+        hand = state.hands[state.turn]
+        moves_key = (hand, state.last_key, state.leader is None)
+        moves = self.moves.get(moves_key)
+        if moves is None:
+            moves = sorted(state.moves(), key=lambda move: (popcount(move), move and key_mask(move)), reverse=True)
+            if len(self.moves) >= self.max_entries:
+                self.moves.clear()
+            self.moves[moves_key] = moves
+
+        if first is not None and first != moves[0]:
+            moves = [first] + [move for move in moves if move != first]
+        return moves
+
+
+    # Alpha-beta search, returns the value of a state for seat within the window (alpha, beta)
+    def search(self, state, seat, alpha, beta):
+        self.nodes += 1
+        if state.winner() is not None:
+            return self.terminal_value(state, seat)
+
+        key = (state, seat)
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            self.table.move_to_end(key)
+            value, kind, first = entry
+            if kind == EXACT:
+                return value
+            elif kind == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+
+            if alpha >= beta:
+                return value
+
+        moves = self.ordered_moves(state, first)
+
+        # A player who can play their whole hand wins, nothing else can do better for them
+        hand = state.hands[state.turn]
+        if hand in moves:
+            best = self.terminal_value(state.apply(hand), seat)
+            self.store(key, (best, EXACT, hand))
+            return best
+
+        start_alpha, start_beta = alpha, beta
+        maximising = state.turn == seat
+        best = None
+        best_move = None
+
+        for move in moves:
+            value = self.search(state.apply(move), seat, alpha, beta)
+
+            if maximising:
+                if best is None or value > best:
+                    best, best_move = value, move
+                alpha = max(alpha, value)
+            else:
+                if best is None or value < best:
+                    best, best_move = value, move
+                beta = min(beta, value)
+
+            if alpha >= beta:
+                break
+
+        if best <= start_alpha:
+            kind = UPPER
+        elif best >= start_beta:
+            kind = LOWER
+        else:
+            kind = EXACT
+
+        self.store(key, (best, kind, best_move))
+        return best
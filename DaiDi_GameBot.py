@@ -4,12 +4,8 @@ Backend GameBot functions
 
 # Framework for testing simple gameplaying bots
 from DaiDi_Discord_Silent import Player, Dai_Di
-
-# Function to return the value of a card
-def card_value(card):
-    suit = ["D", "C", "H", "S"].index(card[0])
-    num = ["3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A", "2"].index(card[1])
-    return 10 * num + suit
+from DaiDi_Cards import CARD_IDS, CARD_TUPLES, card_value, cards_mask, mask_cards, mask_ids, popcount
+from DaiDi_Hands import KEY_SIZE_SHIFT, beats, classify, hand_key, hand_table, legal_moves
 
 
 # Function used to simulate a game of Dai Di
@@ -17,7 +13,7 @@ def card_value(card):
 # card_cost is the sum of the values of the cards remaining in a player's hand at the end of a game
 # action_cost is the total cost of all the actions taken by a bot
 # total_cost is the sum of the card_cost and action_cost
-def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, audible=0):
+def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, audible=0, seed=None):
     '''
     play_lst is a list of functions that play the game
     functions outputs must output a list of valid cards and a list containing the string 'pass'
@@ -27,11 +23,9 @@ def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, a
 
     audible is used to select if status text is printed in the console or not
     > 0 for output and none otherwise
-    '''
-    # Setup variables
-    cards = ([(i, j) for i in ["D", "C", "H", "S"]
-              for j in ["3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A", "2"]])
 
+    seed is used to shuffle the deck, games with the same seed get the same deal
+    '''
     # Game setup
     # Uses the name of the function instead of a custom name
     play_len = len(play_lst)
@@ -39,16 +33,14 @@ def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, a
     p_2 = Player(nickname=play_lst[1 % play_len].__name__ + '2')
     p_3 = Player(nickname=play_lst[2 % play_len].__name__ + '3')
     p_4 = Player(nickname=play_lst[3 % play_len].__name__ + '4')
-    Game = Dai_Di([p_1, p_2, p_3, p_4])
+    Game = Dai_Di([p_1, p_2, p_3, p_4], seed=seed)
 
     # Starting game
-    player_strengths = [sum(map(Game.card_value, Game.deck_list[i::4])) for i in range(4)]
-
-    while min(player_strengths) < 650 or max(player_strengths) > 900:
-        Game.shuffle_deck()
-        player_strengths = [sum(map(Game.card_value, Game.deck_list[i::4])) for i in range(4)]
-
+    Game.balance_deck()
     Game.deal_cards()
+
+    if audible > 0:
+        print(f'Game seed: {Game.seed}')
     starter_player = Game.starting_player()
     play_order = Game.players[starter_player:] + Game.players[:starter_player]
     turn = 0
@@ -56,7 +48,7 @@ def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, a
     # Playing game
     while True:
         current_player = play_order[turn]
-        cards_left = len(current_player.hand)
+        cards_left = current_player.card_count
 
         action = play_lst[(turn) % play_len](current_player, Game.play_area)
 
@@ -79,7 +71,7 @@ def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, a
                     print(f'{current_player.nickname} failed to pass')
 
         elif isinstance(action, list):
-            hand = [card for card in action if card in cards]
+            hand = [card for card in action if card in CARD_IDS]
             game_success = Game.can_play(current_player, hand)
             player_success = current_player.can_play(action)
 
@@ -97,8 +89,8 @@ def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, a
                 if audible > 0:
                     print(f'{current_player.nickname} played {action}: {cards_left}')
                 
-                if len(current_player.hand) == 0:
-                    card_cost = [sum(map(Game.card_value, Game.players[i].hand)) for i in range(4)]
+                if current_player.mask == 0:
+                    card_cost = [sum(map(card_value, mask_ids(Game.players[i].mask))) for i in range(4)]
                     action_cost = [Game.players[i].discord_id for i in range(4)]
                     total_cost = [sum(values) for values in zip(*(card_cost, action_cost))]
                     
@@ -112,16 +104,16 @@ def game_function(play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, a
 
 # Function to check if hand is valid
 import numpy as np
-Game = Dai_Di()
 
 def is_valid(hand):
     while None in hand:
         hand.remove(None)
-    # Returns bool value of whether hand is valid or not
-    return Game.hand_type(hand)
+    # Returns (hand type, rank) from the table of valid hands, hand type is False if hand is not valid
+    return classify(hand) or (False, 0)
 
 playing_cards = [(i, j) for i in ["D", "C", "H", "S"]
                  for j in ["3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A", "2"]]
+playing_cards_index = {card: i for i, card in enumerate(playing_cards)}
 
 # Function to create dummy variable
 # Also adds is_valid bool value at the end
@@ -131,107 +123,79 @@ def card_dummy(hand):
         hand.remove(None)
     dummies = np.zeros(53)
     for card in hand:
-        dummies[playing_cards.index(card)] = 1
+        dummies[playing_cards_index[card]] = 1
     dummies[52] = is_valid(hand)[0] > 0
     return dummies
 
 
-# Checks if hand1 beats hand2
-# Returns False when the hands are different types
-# Returns False when the hands share cards in common
-def hand_compare(hand1, hand2):
-    if not set.isdisjoint(set(hand1), set(hand2)):
-        return False
-    
-    current_play_type = Game.hand_type(hand1)
-    current_suits = [Game.index_func(card[0]) for card in hand1]
-    if ({card[1] for card in hand1} == {'A', '2', '3', '4', '5'}
-        or {card[1] for card in hand1} == {'2', '3', '4', '5', '6'}):
-
-        current_numbers = [Game.index_func(card[1], small_aces=True) for card in hand1]
-
-    else:
-        current_numbers = [Game.index_func(card[1]) for card in hand1]
-
-    previous_play_type = Game.hand_type(hand2)
-    previous_suits = [Game.index_func(card[0]) for card in hand2]
-    if ({card[1] for card in hand2} == {'A', '2', '3', '4', '5'}
-        or {card[1] for card in hand1} == {'2', '3', '4', '5', '6'}):
+# Column of each card id in the dummy variables
+dummy_columns = np.array([playing_cards_index[card] for card in CARD_TUPLES])
+valid_masks = None
 
-        previous_numbers = [Game.index_func(card[1], small_aces=True) for card in hand2]
+# Function to create the dummy variables of a batch of hands
+# hands is a list of hands (None entries are ignored) or an array of hand masks
+# Returns an (N, 53) uint8 matrix, the last column is whether the hand is valid
+def card_dummies(hands):
+    global valid_masks
+    if valid_masks is None:
+        valid_masks = np.array(sorted(hand_table()), dtype=np.int64)
 
+    if isinstance(hands, np.ndarray):
+        masks = hands.astype(np.int64)
+        distinct = True
     else:
-        previous_numbers = [Game.index_func(card[1]) for card in hand2]
-
-    if previous_play_type[0] > 3:
-        if current_play_type[0] > previous_play_type[0]:
-            return True
-
-        elif (current_play_type[0] == previous_play_type[0] and
-              current_play_type[0] in [4, 5, 8, 9]):
-
-            if (current_play_type[0] == 9 and
-                max(current_suits) > max(previous_suits)):
-                return True
+        hands = [[card for card in hand if card is not None] for hand in hands]
+        masks = np.array([cards_mask(hand) for hand in hands], dtype=np.int64).reshape(-1)
+        # A card played twice is only once in the mask, like card_dummy such hands are not valid
+        distinct = np.array([len(hand) == popcount(mask) for hand, mask in zip(hands, masks.tolist())], dtype=bool)
 
-            elif max(current_numbers) > max(previous_numbers):
-                return True
+    dummies = np.zeros((len(masks), 53), dtype=np.uint8)
+    dummies[:, dummy_columns] = (masks[:, None] >> np.arange(52)) & 1
 
-            elif (max(current_numbers) == max(previous_numbers) and
-                max(current_suits) > max(previous_suits)):
-                return True
-
-            return False
-
-        elif (current_play_type[0] == previous_play_type[0] and
-            current_play_type[0] in [6, 7]):
-
-            current_main = [card for card in hand1 if card[1] == hand1[0][1]]
-            current_kicker = [card for card in hand1 if card[1] == hand1[-1][1]]
+    # A hand is valid if its mask is in the sorted array of valid hand masks
+    found = np.searchsorted(valid_masks, masks).clip(max=len(valid_masks) - 1)
+    dummies[:, 52] = (valid_masks[found] == masks) & distinct
+    return dummies
 
-            previous_main = [card for card in hand2 if card[1] == hand2[0][1]]
-            previous_kicker = [card for card in hand2 if card[1] == hand2[0][1]]
 
-            if len(current_kicker) > len(current_main):
-                current_main = [card for card in hand1 if card[1] == hand1[-1][1]]
+# Checks if hand1 beats hand2
+# Returns False when the hands are different types
+# Returns False when the hands share cards in common
+def hand_compare(hand1, hand2):
+    if not set.isdisjoint(set(hand1), set(hand2)):
+        return False
 
-            if len(previous_kicker) > len(previous_main):
-                previous_main = [card for card in hand2 if card[1] == hand2[-1][1]]
+    return beats(hand_key(hand1), hand_key(hand2))
 
-            current_main_numbers = Game.index_func(current_main[0])
-            previous_main_numbers = Game.index_func(current_main[0])
 
-            if current_main_numbers > previous_main_numbers:
-                return True
+# Function to display all valid hands given a player's current hand
+# Hands come from the move generator in DaiDi_Hands, weakest first
+def possible(lst):
+    moves = legal_moves(cards_mask(card for card in lst if card is not None))
+    pair = [mask_cards(mask) for key, mask in moves if key >> KEY_SIZE_SHIFT == 2]
+    triple = [mask_cards(mask) for key, mask in moves if key >> KEY_SIZE_SHIFT == 3]
+    fives = [mask_cards(mask) for key, mask in moves if key >> KEY_SIZE_SHIFT == 5]
 
-            else:
-                return False
+    return (lst, pair, triple, fives)
 
-    elif (previous_play_type[0] <= 3 and 
-          current_play_type[0] == previous_play_type[0]):
 
-        if max(current_numbers) > max(previous_numbers):
-            return True
+# Function to list the hands a player can play on the play_area as (key, mask), weakest first
+# The first hand of the game must contain the Diamond 3
+# Any hand can be played by the player who played the last hand
+def valid_moves(player, play_area):
+    if len(play_area) == 0:
+        return [move for move in legal_moves(player.mask) if move[1] & 1]
 
-        elif (max(current_numbers) == max(previous_numbers) and
-              max(current_suits) > max(previous_suits)):
-            return True
+    elif play_area[-1][1] == player.nickname:
+        return legal_moves(player.mask)
 
-        else:
-            return False
-    
-    return False
+    return legal_moves(player.mask, play_area[-1][4])
 
 
-# Function to display all valid hands given a player's current hand
-# The function is used a brute force method to generate all possible hands since there is only 1664
-# possible combinations
-from itertools import combinations
-def possible(lst):
-    all_comb = [list(card) for i in [1, 2, 3, 5] for card in combinations(lst, r=i)]
-    valid_comb = [card for card in all_comb if is_valid(card)[0] > 0]
-    pair = [card for card in valid_comb if len(card) == 2]
-    triple = [card for card in valid_comb if len(card) == 3]
-    fives = [card for card in valid_comb if len(card) == 5]
-    
-    return (lst, pair, triple, fives)
+# Play function that plays the weakest hand it can and passes when it cannot play
+# The Discord bot falls back on it when a bot seat runs out of time
+def weakest(player, play_area):
+    moves = valid_moves(player, play_area)
+    if not moves:
+        return ['pass']
+    return mask_cards(moves[0][1])
@@ -0,0 +1,219 @@
+'''
+Precomputed hand classification
+
+Every valid 1, 2, 3 and 5 card hand is stored in a table keyed by the mask of its cards
+Looking up a hand returns its type (same digits as Dai_Di.hand_type) and its rank
+Ranks are only comparable between hands of the same type
+
+Hands missing from the table are not valid, so the table covers all ~2.6 million
+five-card subsets while only holding ~20,000 hands
+The table is built the first time it is used (a few tens of milliseconds)
+
+Note: for the hands A2345 and 23456, the A and the 2 are considered "small"
+2AKQJ is not considered a valid hand
+'''
+
+from itertools import combinations, product
+from DaiDi_Cards import SUIT_MASKS, cards_mask, mask_ids, popcount
+
+HAND_NAMES = {1: "Single Card", 2: "Pair", 3: "Three of a Kind", 4: "Straight", 5: "Flush",
+              6: "Full House", 7: "Four of a Kind", 8: "Straight Flush", 9: "Royal Flush"}
+
+# Numbers of the valid straights and the number that ranks them
+# Numbers are indexes in DaiDi_Cards.NUMBERS, so 11 is the A and 12 is the 2
+# The 5 and the 6 are the top cards of A2345 and 23456
+STRAIGHTS = ([((11, 12, 0, 1, 2), 2), ((12, 0, 1, 2, 3), 3)] +
+             [(tuple(range(low, low + 5)), low + 4) for low in range(8)])
+
+# A hand key is size << 10 | hand type << 6 | rank
+# Keys of hands of the same size are in the order in which the hands beat each other
+KEY_SIZE_SHIFT = 10
+
+_table = None
+_keys = None
+
+
+# Builds the table of every valid hand
+def build_table():
+    table = {}
+
+    # Singles, pairs and triples are ranked by their highest card
+    for num in range(13):
+        for size in (1, 2, 3):
+            for suits in combinations(range(4), size):
+                ids = [4 * num + suit for suit in suits]
+                table[cards_mask(ids)] = (size, ids[-1])
+
+    # Straights and straight flushes are ranked by their top card
+    # Royal flushes are the straight flushes from 10 to A
+    straight_sets = set()
+    for numbers, top in STRAIGHTS:
+        straight_sets.add(frozenset(numbers))
+        for suits in product(range(4), repeat=5):
+            ids = [4 * num + suit for num, suit in zip(numbers, suits)]
+            rank = 4 * top + suits[numbers.index(top)]
+
+            if len(set(suits)) > 1:
+                table[cards_mask(ids)] = (4, rank)
+            elif numbers[0] == 7:
+                table[cards_mask(ids)] = (9, rank)
+            else:
+                table[cards_mask(ids)] = (8, rank)
+
+    # Flushes are ranked by their highest card
+    for suit in range(4):
+        for numbers in combinations(range(13), 5):
+            if frozenset(numbers) in straight_sets:
+                continue
+            table[cards_mask(4 * num + suit for num in numbers)] = (5, 4 * numbers[-1] + suit)
+
+    # Full houses and four of a kinds are ranked by the number of their 'main body'
+    for main in range(13):
+        for main_suits in combinations(range(4), 3):
+            main_mask = cards_mask(4 * main + suit for suit in main_suits)
+
+            for pair in range(13):
+                if pair == main:
+                    continue
+                for pair_suits in combinations(range(4), 2):
+                    table[main_mask | cards_mask(4 * pair + suit for suit in pair_suits)] = (6, main)
+
+        quad_mask = 0xF << (4 * main)
+        for kicker in range(52):
+            if kicker >> 2 != main:
+                table[quad_mask | 1 << kicker] = (7, main)
+
+    return table
+
+
+# Returns the table, building it on first use
+def hand_table():
+    global _table
+    if _table is None:
+        _table = build_table()
+    return _table
+
+
+# Returns (hand type, rank) of a hand mask or None if the hand is not valid
+def classify_mask(mask):
+    return (_table or hand_table()).get(mask)
+
+
+# Returns (hand type, rank) of a list of cards or None if the hand is not valid
+# Lists with duplicate or unknown cards are not valid
+def classify(cards):
+    try:
+        mask = cards_mask(cards)
+
+    except ValueError:
+        return None
+
+    if len(cards) != popcount(mask):
+        return None
+
+    return classify_mask(mask)
+
+
+# Returns the table of hand keys, building it on first use
+def key_table():
+    global _keys
+    if _keys is None:
+        _keys = {mask: popcount(mask) << KEY_SIZE_SHIFT | hand_type << 6 | rank
+                 for mask, (hand_type, rank) in hand_table().items()}
+    return _keys
+
+
+# Returns the key of a hand mask or None if the hand is not valid
+def key_mask(mask):
+    return (_keys or key_table()).get(mask)
+
+
+# Returns the key of a list of cards or None if the hand is not valid
+def hand_key(cards):
+    try:
+        mask = cards_mask(cards)
+
+    except ValueError:
+        return None
+
+    if len(cards) != popcount(mask):
+        return None
+
+    return key_mask(mask)
+
+
+# Checks if the hand with key beats the hand with previous_key
+# Hands only beat hands with the same number of cards
+def beats(key, previous_key):
+    return (key is not None and previous_key is not None and
+            key >> KEY_SIZE_SHIFT == previous_key >> KEY_SIZE_SHIFT and
+            key > previous_key)
+
+
+# Sub-masks of each 4 bit number nibble, by size
+# _nibble_subsets[nibble][size] lists the nibble's sub-masks with size cards
+_nibble_subsets = [[[sub for sub in range(16) if sub & ~nibble == 0 and popcount(sub) == size]
+                    for size in range(5)] for nibble in range(16)]
+
+
+# Returns every valid hand that can be made from a hand mask as a list of (key, mask)
+# The list is sorted from the weakest to the strongest hand
+# If previous_key is given, only the hands that beat it are returned
+# Hands are built from the numbers and suits of the hand instead of trying every combination
+def legal_moves(hand_mask, previous_key=None):
+    keys = _keys or key_table()
+    size = None if previous_key is None else previous_key >> KEY_SIZE_SHIFT
+    nibbles = [hand_mask >> (4 * num) & 0xF for num in range(13)]
+    masks = []
+
+    # Singles, pairs and triples from the cards of each number
+    for group in (1, 2, 3):
+        if size is None or size == group:
+            for num, nibble in enumerate(nibbles):
+                for sub in _nibble_subsets[nibble][group]:
+                    masks.append(sub << (4 * num))
+
+    if size is None or size == 5:
+        # Straights and straight flushes from runs of numbers
+        for numbers, top in STRAIGHTS:
+            run = [0]
+            for num in numbers:
+                singles = _nibble_subsets[nibbles[num]][1]
+                if not singles:
+                    break
+                run = [mask | sub << (4 * num) for mask in run for sub in singles]
+            else:
+                masks.extend(run)
+
+        # Flushes from suits with five cards or more, the straight flushes are already in
+        for suit_mask in SUIT_MASKS:
+            suited = hand_mask & suit_mask
+            if popcount(suited) >= 5:
+                for ids in combinations(mask_ids(suited), 5):
+                    mask = cards_mask(ids)
+                    if keys[mask] >> 6 & 0xF == 5:
+                        masks.append(mask)
+
+        # Full houses and four of a kinds from the counts of each number
+        pairs = [sub << (4 * num) for num, nibble in enumerate(nibbles)
+                 for sub in _nibble_subsets[nibble][2]]
+
+        for num, nibble in enumerate(nibbles):
+            for sub in _nibble_subsets[nibble][3]:
+                triple = sub << (4 * num)
+                masks.extend(triple | pair for pair in pairs if not pair & 0xF << (4 * num))
+
+            if nibble == 0xF:
+                quad = 0xF << (4 * num)
+                rest = hand_mask & ~quad
+                while rest:
+                    low = rest & -rest
+                    masks.append(quad | low)
+                    rest ^= low
+
+    moves = [(keys[mask], mask) for mask in masks]
+    if previous_key is not None:
+        moves = [move for move in moves if move[0] > previous_key]
+
+    moves.sort()
+    return moves
@@ -0,0 +1,195 @@
+'''
+Leaderboard of skill ratings with rank queries
+
+Ratings are kept in an indexable skip list ordered from the highest to the lowest rating
+Every link of the skip list stores how many players it skips, so the rank of a rating and
+the player at a rank are found in O(log n) steps instead of sorting all the ratings
+Players with the same rating share a rank (1, 2, 2, 4)
+'''
+
+from random import Random
+
+MAX_LEVEL = 32
+
+
+# Node of the skip list, the head node has no key
+class SkipNode:
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+# Sorted list of unique keys with O(log n) insert, remove, bisect and index
+class SkipList:
+    def __init__(self, rng=None):
+        self.rng = Random() if rng is None else rng
+        self.head = SkipNode(None, MAX_LEVEL)
+        self.size = 0
+        self.level = 1 # levels in use, the links above only point to None
+
+
+    def __len__(self):
+        return self.size
+
+
+    # Returns the last node of every level before key and the number of keys before each of them
+    # Links to None have no width to keep up to date
+    def search(self, key):
+        chain = [self.head] * MAX_LEVEL
+        steps = [0] * MAX_LEVEL
+        node = self.head
+        position = 0
+
+        for level in reversed(range(self.level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            steps[level] = position
+
+        return chain, steps
+
+
+    # Inserts a key, the height of its node is picked at random (1 with probability 1/2, 2 with 1/4...)
+    def insert(self, key):
+        chain, steps = self.search(key)
+        level = 1
+        while level < MAX_LEVEL and self.rng.random() < 0.5:
+            level += 1
+
+        node = SkipNode(key, level)
+        position = steps[0] + 1 # position of the new node, the head is at 0
+
+        for i in range(level):
+            before = chain[i]
+            node.next[i] = before.next[i]
+            node.width[i] = steps[i] + before.width[i] - position + 1
+            before.next[i] = node
+            before.width[i] = position - steps[i]
+
+        for i in range(level, self.level):
+            chain[i].width[i] += 1
+
+        self.level = max(self.level, level)
+        self.size += 1
+
+
+    # Removes a key, raises KeyError if it is not in the list
+    def remove(self, key):
+        chain = self.search(key)[0]
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        for i in range(len(node.next)):
+            before = chain[i]
+            before.width[i] += node.width[i] - 1
+            before.next[i] = node.next[i]
+
+        for i in range(len(node.next), self.level):
+            chain[i].width[i] -= 1
+
+        self.size -= 1
+
+
+    # Returns the number of keys lower than key
+    def bisect(self, key):
+        return self.search(key)[1][0]
+
+
+    # Returns the key at an index (0 for the lowest key)
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+
+        node = self.head
+        remaining = index + 1
+        for level in reversed(range(self.level)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+
+        return node.key
+
+
+    # Iterates over the first n keys from the lowest
+    def first(self, n):
+        node = self.head.next[0]
+        while node is not None and n > 0:
+            yield node.key
+            node = node.next[0]
+            n -= 1
+
+
+# Ratings of players keyed by user id, updated one rating at a time
+# Keys in the skip list are (-rating, user id) so the highest rating comes first
+class Leaderboard:
+    def __init__(self, ratings=(), rng=None):
+        self.ratings = {}
+        self.index = SkipList(rng)
+        for user_id, rating in ratings:
+            self.update(user_id, rating)
+
+
+    def __len__(self):
+        return len(self.ratings)
+
+
+    def __contains__(self, user_id):
+        return user_id in self.ratings
+
+
+    # Sets the rating of a player
+    def update(self, user_id, rating):
+        old = self.ratings.get(user_id)
+        if old is not None:
+            if old == rating:
+                return
+            self.index.remove((-old, user_id))
+
+        self.ratings[user_id] = rating
+        self.index.insert((-rating, user_id))
+
+
+    # Removes a player from the leaderboard
+    def remove(self, user_id):
+        rating = self.ratings.pop(user_id, None)
+        if rating is not None:
+            self.index.remove((-rating, user_id))
+
+
+    # Returns the rank of a player (1 for the highest rating) or None if they have no rating
+    def rank(self, user_id):
+        rating = self.ratings.get(user_id)
+        if rating is None:
+            return None
+
+        # User ids are strings, so (-rating, '') comes before every player with this rating
+        return self.index.bisect((-rating, '')) + 1
+
+
+    # Returns the percentage of players with a lower rating than a player or None if they have no rating
+    def percentile(self, user_id):
+        rating = self.ratings.get(user_id)
+        if rating is None:
+            return None
+
+        # (-rating, chr(0x10ffff)) comes after every player with this rating
+        lower = len(self.index) - self.index.bisect((-rating, chr(0x10ffff)))
+        return 100 * lower / len(self.index)
+
+
+    # Returns the (user id, rating) of the player at a rank
+    def at_rank(self, rank):
+        rating, user_id = self.index[rank - 1]
+        return (user_id, -rating)
+
+
+    # Returns the (rank, user id, rating) of the k players with the highest ratings
+    def top(self, k):
+        entries = []
+        for i, (rating, user_id) in enumerate(self.index.first(k)):
+            rank = entries[-1][0] if entries and entries[-1][2] == -rating else i + 1
+            entries.append((rank, user_id, -rating))
+        return entries
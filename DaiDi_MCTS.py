@@ -0,0 +1,240 @@
+'''
+Information Set Monte Carlo Tree Search bot (single observer ISMCTS, Cowling et al. 2012)
+
+Every iteration deals the cards the bot cannot see to the other players (a determinization),
+then walks down one shared tree of moves, adds a move, plays the game out at random and scores it
+Hands are dealt with the number of cards each player has left after the hands in play_area
+Playouts are scored with GameState.scores
+Passes are not recorded in play_area, so the order of the other players is dealt at random as well
+
+Positions are GameStates (see DaiDi_State) seen from the bot, which is always seat 0
+ISMCTSBot is a play function for game_function, the Simulator and the Discord bot seats:
+bot(player, play_area) returns a list of cards or ['pass']
+Once every player holds few cards the bot solves determinizations exactly (see DaiDi_Endgame)
+and plays the move that forces a win in most of them, searching as usual when none does
+'''
+
+from math import log, sqrt
+from random import Random
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from DaiDi_Cards import FULL_DECK, mask_cards, mask_ids, popcount
+from DaiDi_State import GameState, PASS
+from DaiDi_Endgame import ENDGAME_CARDS, EndgameSolver, is_endgame
+
+EXPLORATION = 0.7
+
+
+# Node of the search tree, the move that led to it and the seat that played it
+class Node:
+    __slots__ = ('move', 'player', 'parent', 'children', 'visits', 'reward', 'avails')
+
+    def __init__(self, move=None, player=None, parent=None):
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.avails = 1
+
+
+    # Upper confidence bound, avails counts the iterations where the move was legal
+    def ucb(self, exploration=EXPLORATION):
+        return self.reward / self.visits + exploration * sqrt(log(self.avails) / self.visits)
+
+
+# Returns what the bot knows about the game: (its hand, its nickname, [(nickname, mask, key) of every play])
+def observe(player, play_area):
+    return (player.mask, player.nickname, [(play[1], play[3], play[4]) for play in play_area])
+
+
+# Deals the cards the bot cannot see to the other players and returns the position as a GameState
+# The bot is seat 0 and plays next, the other players get seats 1 to 3 in a random order
+def determinize(observation, rng):
+    hand, nickname, plays = observation
+    played = 0
+    played_by = {}
+    for name, mask, key in plays:
+        played |= mask
+        played_by[name] = played_by.get(name, 0) + popcount(mask)
+
+    # Players that have not played a hand yet have no name
+    others = [name for name in played_by if name != nickname]
+    others += [None] * (3 - len(others))
+    rng.shuffle(others)
+
+    unseen = mask_ids(FULL_DECK & ~hand & ~played)
+    rng.shuffle(unseen)
+
+    hands = [hand]
+    start = 0
+    for name in others:
+        count = 13 - played_by.get(name, 0)
+        mask = 0
+        for card in unseen[start:start + count]:
+            mask |= 1 << card
+        hands.append(mask)
+        start += count
+
+    if not plays:
+        return GameState(hands, turn=0)
+
+    # The players between the leader and the bot have passed
+    last_name, last_mask, last_key = plays[-1]
+    leader = 0 if last_name == nickname else others.index(last_name) + 1
+    if leader == 0:
+        return GameState(hands, None, 0, 0, 0)
+    return GameState(hands, last_key, leader, (-leader - 1) % 4, 0)
+
+
+# Runs the search from an observation for a number of iterations or seconds, whichever ends first
+# Returns the number of visits of each move of the bot
+def search(observation, iterations=1000, time_limit=None, seed=None):
+    rng = Random(seed)
+    root = Node()
+    deadline = None if time_limit is None else perf_counter() + time_limit
+
+    for iteration in range(iterations):
+        if deadline is not None and perf_counter() > deadline:
+            break
+
+        state = determinize(observation, rng)
+        node = root
+
+        # Selection and expansion, only moves that are legal in this determinization are considered
+        while state.winner() is None:
+            moves = state.moves()
+            untried = [move for move in moves if move not in node.children]
+
+            for move in moves:
+                child = node.children.get(move)
+                if child is not None:
+                    child.avails += 1
+
+            if untried:
+                move = rng.choice(untried)
+                child = node.children[move] = Node(move, state.turn, node)
+                state = state.apply(move)
+                node = child
+                break
+
+            node = max((node.children[move] for move in moves), key=Node.ucb)
+            state = state.apply(node.move)
+
+        # Playout
+        while state.winner() is None:
+            state = state.apply(rng.choice(state.moves()))
+
+        # Backpropagation, every node scores the game for the seat that played its move
+        scores = state.scores()
+        while node is not None:
+            node.visits += 1
+            if node.player is not None:
+                node.reward += scores[node.player]
+            node = node.parent
+
+    return {move: child.visits for move, child in root.children.items()}
+
+
+# Runs search in worker processes with different seeds and adds up the visits (root parallelisation)
+def parallel_search(executor, workers, observation, iterations, time_limit, seed):
+    rng = Random(seed)
+    futures = [executor.submit(search, observation, -(-iterations // workers), time_limit, rng.getrandbits(32))
+               for _ in range(workers)]
+
+    visits = {}
+    for future in futures:
+        for move, count in future.result().items():
+            visits[move] = visits.get(move, 0) + count
+    return visits
+
+
+# Play function that searches for its move
+# iterations and time_limit (seconds) bound each search, workers > 1 spreads the iterations over processes
+# Instances can be sent to worker processes, e.g. by the Tournament
+# endgame_cards and endgame_samples set when the endgame solver takes over and how many deals it solves
+class ISMCTSBot:
+    def __init__(self, iterations=500, time_limit=None, workers=1, seed=None, name='ismcts',
+                 endgame_cards=ENDGAME_CARDS, endgame_samples=10):
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.workers = workers
+        self.endgame_cards = endgame_cards
+        self.endgame_samples = endgame_samples
+        self.rng = Random(seed)
+        self.executor = None
+        self.solver = EndgameSolver()
+        self.__name__ = name
+
+
+    # The process pool stays with the process that created it, the transposition table is not copied
+    # Every copy gets a new random generator, so a bot copied for each move does not replay the same seeds
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['solver'] = EndgameSolver()
+        state['rng'] = Random(self.rng.getrandbits(32))
+        return state
+
+
+    # Solves determinizations of an endgame until deadline (perf_counter time, None for no limit)
+    # and returns the winning move found in most of them, None if the bot cannot force a win in any of them
+    def endgame_move(self, observation, deadline=None):
+        wins = {}
+
+        for sample in range(self.endgame_samples):
+            if deadline is not None and perf_counter() > deadline:
+                break
+            move, value = self.solver.solve(determinize(observation, self.rng), 0)
+            if value == 1:
+                wins[move] = wins.get(move, 0) + 1
+
+        return max(wins, key=wins.get, default=None)
+
+
+    # Returns the mask of the move to play, PASS to pass
+    # The endgame solver and the search share one time_limit
+    def choose(self, player, play_area):
+        deadline = None if self.time_limit is None else perf_counter() + self.time_limit
+        observation = observe(player, play_area)
+        state = determinize(observation, self.rng)
+        moves = state.moves()
+        if len(moves) == 1:
+            return moves[0]
+
+        if self.endgame_samples and is_endgame(state, self.endgame_cards):
+            move = self.endgame_move(observation, deadline)
+            if move is not None:
+                return move
+
+        # Worker processes get the time left rather than the deadline, their clocks may differ
+        time_limit = None if deadline is None else max(deadline - perf_counter(), 0)
+        seed = self.rng.getrandbits(32)
+        if self.workers > 1:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            visits = parallel_search(self.executor, self.workers, observation, self.iterations, time_limit, seed)
+        else:
+            visits = search(observation, self.iterations, time_limit, seed)
+
+        # Our own moves do not depend on the determinization, so every move of the root is legal
+        return max(moves, key=lambda move: visits.get(move, 0))
+
+
+    def __call__(self, player, play_area):
+        move = self.choose(player, play_area)
+        if move == PASS:
+            return ['pass']
+        return mask_cards(move)
+
+
+    # Shuts down the worker processes
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+# Default bot for play_lst, e.g. game_function([ismcts, ...])
+ismcts = ISMCTSBot()
@@ -0,0 +1,288 @@
+'''
+Outbound message queue for the Discord bot
+
+Commands post their replies to the outbox instead of awaiting channel.send
+A scheduler task sends the queued messages within local sliding window budgets:
+one window per channel (Discord allows about 5 messages per 5 seconds in a channel) and one for the bot
+A window counts the sends of the last period, so no period ever holds more than its limit
+
+Each channel queue keeps its messages in the order they were posted. Consecutive queued messages are merged
+into one message of at most 2000 characters, so "X played ..." and "Y turn now" go out in a single call
+The kind of a message (turn prompt, status line or information such as hand displays) only decides
+which channel sends next: when the global budget runs short, channels waiting on a turn prompt are served first
+
+FakeTransport and outbox_report benchmark the scheduler without a network
+'''
+
+import asyncio
+from collections import deque
+from time import monotonic
+from DaiDi_Render import MESSAGE_LIMIT, split_block
+
+# Kinds of messages, channels with lower kinds queued are served first
+PROMPT = 0
+STATUS = 1
+INFO = 2
+
+CHANNEL_LIMIT = (5, 5.0) # messages per seconds in a channel
+GLOBAL_LIMIT = (50, 1.0) # messages per seconds for the bot
+
+
+# Budget of at most capacity messages in any period seconds, kept as the times of the last sends
+class SlidingWindow:
+    def __init__(self, capacity, period, clock=monotonic):
+        self.capacity = capacity
+        self.period = period
+        self.clock = clock
+        self.times = deque()
+
+
+    # Returns the seconds to wait before the next send, 0 if it can send now
+    def wait_time(self):
+        now = self.clock()
+        while self.times and self.times[0] <= now - self.period:
+            self.times.popleft()
+
+        if len(self.times) < self.capacity:
+            return 0
+        # Never 0 while the window is full, rounding could otherwise send one message early
+        return max(self.times[0] + self.period - now, 1e-6)
+
+
+    def take(self):
+        self.times.append(self.clock())
+
+
+# Sends messages with channel.send
+class ChannelTransport:
+    async def send(self, channel, text):
+        await channel.send(text)
+
+
+class Outbox:
+    def __init__(self, transport=None, channel_limit=CHANNEL_LIMIT, global_limit=GLOBAL_LIMIT,
+                 limit=MESSAGE_LIMIT, clock=monotonic):
+        self.transport = ChannelTransport() if transport is None else transport
+        self.channel_limit = channel_limit
+        self.limit = limit
+        self.clock = clock
+        self.global_window = SlidingWindow(*global_limit, clock)
+        self.channels = {} # channel id: queue state
+        self.sends = set()
+        self.wakeup = None
+
+
+    # Queues a message for a channel, messages longer than the limit are split at line breaks
+    def post(self, channel, text, kind=STATUS):
+        state = self.channels.get(channel.id)
+        if state is None:
+            state = self.channels[channel.id] = {'channel': channel, 'queue': deque(), 'counts': [0, 0, 0],
+                                                 'sending': False,
+                                                 'window': SlidingWindow(*self.channel_limit, self.clock)}
+
+        now = self.clock()
+        for piece in split_block(text, self.limit):
+            state['queue'].append((now, kind, piece))
+            state['counts'][kind] += 1
+
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+
+    # Queues the blocks of a display
+    def post_blocks(self, channel, blocks, kind=INFO):
+        for block in blocks:
+            self.post(channel, block, kind)
+
+
+    # Returns the number of queued messages and sends in flight
+    def pending(self):
+        return sum(len(state['queue']) for state in self.channels.values()) + len(self.sends)
+
+
+    # Returns the channel to send to next, or None and the seconds to wait before a channel can send
+    # Channels with a turn prompt come first, then channels with status lines, then the oldest messages
+    def next_channel(self):
+        best = None
+        best_key = None
+        wait = None
+
+        for state in self.channels.values():
+            if state['sending'] or not state['queue']:
+                continue
+
+            channel_wait = state['window'].wait_time()
+            if channel_wait > 0:
+                wait = channel_wait if wait is None else min(wait, channel_wait)
+                continue
+
+            counts = state['counts']
+            key = (PROMPT if counts[PROMPT] else STATUS if counts[STATUS] else INFO, state['queue'][0][0])
+            if best_key is None or key < best_key:
+                best, best_key = state, key
+
+        if best is not None:
+            global_wait = self.global_window.wait_time()
+            if global_wait > 0:
+                return (None, global_wait)
+
+        return (best, wait)
+
+
+    # Takes the next message of a channel, merging queued messages in order while they fit in one message
+    def take_message(self, state):
+        queue = state['queue']
+        lines = []
+        length = -1
+        while queue and length + 1 + len(queue[0][2]) <= self.limit:
+            _, kind, text = queue.popleft()
+            state['counts'][kind] -= 1
+            lines.append(text)
+            length += 1 + len(text)
+
+        return '\n'.join(lines)
+
+
+    # The channel window counts the send when it starts, a channel sends one message at a time
+    async def send(self, state, text):
+        try:
+            state['window'].take()
+            await self.transport.send(state['channel'], text)
+        except Exception as error:
+            print(f'Could not send to channel {state["channel"].id}: {error}')
+        finally:
+            state['sending'] = False
+            self.wakeup.set()
+
+
+    # Scheduler, runs until cancelled
+    # Channels send one message at a time so their messages keep their order
+    async def run(self):
+        self.wakeup = asyncio.Event()
+
+        while True:
+            state, wait = self.next_channel()
+            if state is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            text = self.take_message(state)
+            self.global_window.take()
+            state['sending'] = True
+
+            task = asyncio.ensure_future(self.send(state, text))
+            self.sends.add(task)
+            task.add_done_callback(self.sends.discard)
+
+
+    # Waits until every queued message is sent
+    async def drain(self, interval=0.05):
+        while self.pending():
+            await asyncio.sleep(interval)
+
+
+# Transport that records messages instead of sending them
+# Counts the sends that go over the channel limit, which Discord would answer with 429 Too Many Requests
+class FakeTransport:
+    def __init__(self, latency=0.0, channel_limit=CHANNEL_LIMIT, clock=monotonic):
+        self.latency = latency
+        self.capacity, self.period = channel_limit
+        self.clock = clock
+        self.sent = [] # (time, channel id, text)
+        self.history = {} # channel id: send times within the last period
+        self.limited = 0
+
+
+    async def send(self, channel, text):
+        now = self.clock()
+        times = self.history.setdefault(channel.id, deque())
+        while times and times[0] <= now - self.period:
+            times.popleft()
+        if len(times) >= self.capacity:
+            self.limited += 1
+        times.append(now)
+
+        await asyncio.sleep(self.latency)
+        self.sent.append((self.clock(), channel.id, text))
+
+
+# Channel for FakeTransport
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+# Plays n_turns turns on n_tables tables at once, every turn posts a status line and a turn prompt
+# and every fourth turn the hands of the table
+# Sends the messages directly (one call per message) and through an Outbox, with time_scale shrinking the limits
+# Returns a text report with the calls, the sends over the limits and the delay of the turn prompts
+def outbox_report(n_tables=20, n_turns=40, turn_time=0.01, latency=0.002, time_scale=0.01):
+    channel_limit = (CHANNEL_LIMIT[0], CHANNEL_LIMIT[1] * time_scale)
+    global_limit = (GLOBAL_LIMIT[0], GLOBAL_LIMIT[1] * time_scale)
+    hand = 'By value:\n||' + 'D 3, ' * 13 + '||\n'
+    channels = [FakeChannel(i) for i in range(n_tables)]
+
+    async def play(post):
+        prompts = {}
+        for turn in range(n_turns):
+            for channel in channels:
+                post(channel, f'Player {turn % 4} played the Single Card', STATUS)
+                prompt = f'Player {(turn + 1) % 4} turn now ({turn})'
+                prompts[(channel.id, prompt)] = monotonic()
+                post(channel, prompt, PROMPT)
+                if turn % 4 == 3:
+                    for seat in range(4):
+                        post(channel, f'Player {seat}\'s Hand\n{hand}', INFO)
+            await asyncio.sleep(turn_time)
+        return prompts
+
+    async def direct():
+        transport = FakeTransport(latency, channel_limit)
+        queues = {channel.id: asyncio.Queue() for channel in channels}
+
+        async def worker(channel):
+            while True:
+                await transport.send(channel, await queues[channel.id].get())
+                queues[channel.id].task_done()
+
+        workers = [asyncio.ensure_future(worker(channel)) for channel in channels]
+        start = monotonic()
+        prompts = await play(lambda channel, text, kind: queues[channel.id].put_nowait(text))
+        for queue in queues.values():
+            await queue.join()
+        elapsed = monotonic() - start
+        for task in workers:
+            task.cancel()
+        return transport, prompts, elapsed
+
+    async def queued():
+        transport = FakeTransport(latency, channel_limit)
+        outbox = Outbox(transport, channel_limit, global_limit)
+        scheduler = asyncio.ensure_future(outbox.run())
+        start = monotonic()
+        prompts = await play(outbox.post)
+        await outbox.drain(interval=0.001)
+        elapsed = monotonic() - start
+        scheduler.cancel()
+        return transport, prompts, elapsed
+
+    lines = [f'{n_tables} tables, {n_turns} turns, limits of {channel_limit[0]} messages per {channel_limit[1]}s '
+             f'per channel and {global_limit[0]} per {global_limit[1]}s in total']
+
+    for name, run in (('Direct', direct), ('Outbox', queued)):
+        transport, prompts, elapsed = asyncio.run(run())
+        delays = []
+        for sent_time, channel_id, text in transport.sent:
+            for line in text.split('\n'):
+                posted = prompts.pop((channel_id, line), None)
+                if posted is not None:
+                    delays.append(sent_time - posted)
+
+        lines.append(f'{name}: {len(transport.sent)} calls in {elapsed:.2f}s, {transport.limited} over the channel limit, '
+                     f'prompt delay mean {sum(delays) / len(delays) * 1000:.1f} ms max {max(delays) * 1000:.1f} ms')
+
+    return '\n'.join(lines)
@@ -0,0 +1,124 @@
+'''
+Parser for the cards typed in !playcard
+
+Text is read in a single pass with one precompiled pattern, every token is looked up in a table built once:
+suits ("d", "diamond", "diamonds", ":diamonds:", "♦"), numbers ("k", "king", "10", "ten")
+and whole cards ("dk", "kd", "10h", "h10")
+A suit and a number next to each other make a card, in either order, so all these are the Diamond King:
+"D K", "dk", "kd", "diamond king", "king of diamonds", "K♦"
+Commas, spaces and other punctuation only separate tokens
+
+parse_cards returns the card ids and a list of errors (position in the text, token, reason)
+'''
+
+import re
+from DaiDi_Cards import NUMBERS, SUITS
+
+# Kinds of tokens
+CARD = 0
+SUIT = 1
+NUMBER = 2
+
+# Reasons of errors
+UNKNOWN = 'unknown'
+INCOMPLETE = 'incomplete'
+DUPLICATE = 'duplicate'
+
+ERROR_TEXT = {UNKNOWN: 'is not a card', INCOMPLETE: 'needs both a suit and a number', DUPLICATE: 'is there twice'}
+
+SUIT_WORDS = (('d', 'diamond', 'diamonds', ':diamonds:', '♦', '♢'),
+              ('c', 'club', 'clubs', ':clubs:', '♣', '♧'),
+              ('h', 'heart', 'hearts', ':hearts:', '♥', '♡'),
+              ('s', 'spade', 'spades', ':spades:', '♠', '♤'))
+
+NUMBER_WORDS = (('3', 'three'), ('4', 'four'), ('5', 'five'), ('6', 'six'), ('7', 'seven'), ('8', 'eight'),
+                ('9', 'nine'), ('10', 'ten'), ('j', 'jack'), ('q', 'queen'), ('k', 'king'), ('a', 'ace'),
+                ('2', 'two'))
+
+# Words that are skipped, as in "king of diamonds"
+FILLER = frozenset(('of', 'and'))
+
+# Shortcodes, suit symbols (the emoji variation selector after them is skipped) and words
+TOKEN_PATTERN = re.compile(r':[a-z]+:|[♠-♧]|[a-z0-9]+')
+
+
+# Returns the table of every token: (CARD, card id), (SUIT, suit) or (NUMBER, number)
+def build_tokens():
+    tokens = {}
+    for suit, words in enumerate(SUIT_WORDS):
+        for word in words:
+            tokens[word] = (SUIT, suit)
+
+    for number, words in enumerate(NUMBER_WORDS):
+        for word in words:
+            tokens[word] = (NUMBER, number)
+
+    # Short forms of whole cards, suit then number or number then suit
+    for number, number_text in enumerate(NUMBERS):
+        for suit, suit_text in enumerate(SUITS):
+            for word in (suit_text.lower() + number_text.lower(), number_text.lower() + suit_text.lower()):
+                assert word not in tokens, word
+                tokens[word] = (CARD, 4 * number + suit)
+
+    return tokens
+
+
+TOKENS = build_tokens()
+
+
+# Reads the card ids in a text
+# Returns (card ids in the order they were typed, errors)
+# Each error is (position in the text, token, reason), reason is one of UNKNOWN, INCOMPLETE and DUPLICATE
+def parse_cards(text):
+    cards = []
+    errors = []
+    seen = 0 # mask of the cards read so far
+    pending = None # (kind, value, match) of a suit or number waiting for its pair
+
+    text = text.lower()
+    for match in TOKEN_PATTERN.finditer(text):
+        entry = TOKENS.get(match.group())
+        if entry is None:
+            if match.group() not in FILLER:
+                errors.append((match.start(), match.group(), UNKNOWN))
+            continue
+
+        kind, value = entry
+        start = match.start()
+        if kind == CARD:
+            card = value
+
+        elif pending is None:
+            pending = (kind, value, match)
+            continue
+
+        elif pending[0] == kind:
+            errors.append((pending[2].start(), pending[2].group(), INCOMPLETE))
+            pending = (kind, value, match)
+            continue
+
+        else:
+            suit, number = (value, pending[1]) if kind == SUIT else (pending[1], value)
+            card = 4 * number + suit
+            start = pending[2].start()
+            pending = None
+
+        if pending is not None:
+            errors.append((pending[2].start(), pending[2].group(), INCOMPLETE))
+            pending = None
+
+        if seen >> card & 1:
+            errors.append((start, text[start:match.end()], DUPLICATE))
+        else:
+            seen |= 1 << card
+            cards.append(card)
+
+    if pending is not None:
+        errors.append((pending[2].start(), pending[2].group(), INCOMPLETE))
+
+    return (cards, errors)
+
+
+# Returns the text of a list of errors, one line per error
+def error_text(errors):
+    return '\n'.join(f'"{token}" {ERROR_TEXT[reason]}' for position, token, reason in errors)
@@ -0,0 +1,209 @@
+'''
+Rating store for the Discord bot, backed by a local SQLite file
+
+Ratings are keyed by the discord id of players as a string, like the old elo.txt file
+The store behaves like the dict the bot used to keep: `key in store`, store[key], store[key] = rating
+
+The results of rated games are kept as well so the ratings can be recomputed from the whole history
+Writes are held in memory and written in one transaction by flush (write-behind)
+SQLite commits are atomic, so a crash loses at most the writes since the last flush and never corrupts the file
+Writes go through their own connection outside the lock of the store, so lookups from the event loop
+never wait for a flush or a rerate (WAL lets the file be read while it is written)
+An existing elo.txt is imported the first time the store is opened, its ratings are kept as the baseline
+the history is recomputed from, players who were not imported start from the default rating
+The leaderboard (see DaiDi_Leaderboard) is loaded once and updated with every rating that is set
+'''
+
+import json
+import sqlite3
+import threading
+from DaiDi_Leaderboard import Leaderboard
+
+
+class RatingStore:
+    def __init__(self, path='elo.db', legacy_path='elo.txt'):
+        self.path = path
+        self.lock = threading.Lock() # guards the in-memory state, flush runs in an executor thread
+        self.write_lock = threading.Lock() # one writer at a time
+        self.cache = {}
+        self.pending = {}
+        self.pending_games = []
+        self.flushing = {} # ratings being written by flush
+        self.closed = False
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        # NUMERIC keeps whole ratings as integers and infinite ratings as reals
+        self.connection.execute('CREATE TABLE IF NOT EXISTS ratings (user_id TEXT PRIMARY KEY, rating NUMERIC NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS games (game_id INTEGER PRIMARY KEY, '
+                                'user_ids TEXT NOT NULL, costs TEXT NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS baseline (user_id TEXT PRIMARY KEY, rating NUMERIC NOT NULL)')
+        self.connection.commit()
+
+        self.writer = sqlite3.connect(path, check_same_thread=False)
+        self.writer.execute('PRAGMA synchronous=NORMAL')
+
+        empty = self.connection.execute('SELECT 1 FROM ratings LIMIT 1').fetchone() is None
+        if legacy_path is not None and empty:
+            self.import_json(legacy_path)
+
+        self.leaderboard = Leaderboard(self.items())
+
+
+    # Imports the ratings of an elo.txt file, does nothing if the file does not exist
+    # Only discord ids are imported, old files hold a {'player_name': 10000} placeholder as well
+    # The ratings are the baseline of the players, their ratings before any recorded game
+    def import_json(self, legacy_path):
+        try:
+            with open(legacy_path, 'r') as elo_file:
+                ratings = json.load(elo_file)
+
+        except FileNotFoundError:
+            return False
+
+        rows = [(str(key), value) for key, value in ratings.items() if str(key).isdigit()]
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO ratings VALUES (?, ?)', rows)
+            self.connection.executemany('INSERT OR REPLACE INTO baseline VALUES (?, ?)', rows)
+        return True
+
+
+    # Returns the rating of a player or default if they have none
+    # Lookups go to the cache first, then to the primary key of the table
+    def get(self, user_id, default=None):
+        with self.lock:
+            if user_id in self.cache:
+                return self.cache[user_id]
+
+            row = self.connection.execute('SELECT rating FROM ratings WHERE user_id = ?', (user_id,)).fetchone()
+            if row is None:
+                return default
+
+            self.cache[user_id] = row[0]
+            return row[0]
+
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+
+    def __getitem__(self, user_id):
+        rating = self.get(user_id)
+        if rating is None:
+            raise KeyError(user_id)
+        return rating
+
+
+    # Sets the rating of a player, written to the file on the next flush
+    def __setitem__(self, user_id, rating):
+        with self.lock:
+            self.check_open()
+            self.cache[user_id] = rating
+            self.pending[user_id] = rating
+            self.leaderboard.update(user_id, rating)
+
+
+    # Returns every (user id, rating) pair, including the ones not flushed yet
+    def items(self):
+        with self.lock:
+            ratings = dict(self.connection.execute('SELECT user_id, rating FROM ratings'))
+            ratings.update(self.flushing)
+            ratings.update(self.pending)
+        return ratings.items()
+
+
+    # Records the result of a rated game, written to the file on the next flush
+    # user_ids and costs are lists with an entry per player
+    def add_game(self, user_ids, costs):
+        with self.lock:
+            self.check_open()
+            self.pending_games.append((json.dumps(list(user_ids)), json.dumps(list(costs))))
+
+
+    # Returns the (user ids, costs) of every recorded game, oldest first
+    def games(self):
+        self.flush()
+        with self.lock:
+            rows = self.connection.execute('SELECT user_ids, costs FROM games ORDER BY game_id').fetchall()
+        return [(json.loads(user_ids), json.loads(costs)) for user_ids, costs in rows]
+
+
+    # Returns the ratings imported from elo.txt as a dict, the ratings of these players before any recorded game
+    def baseline(self):
+        with self.lock:
+            return dict(self.connection.execute('SELECT user_id, rating FROM baseline'))
+
+
+    # Replaces every rating with the ratings of a dict in one transaction
+    # Ratings set while the table is written stay pending and are written by the next flush
+    def replace_ratings(self, ratings):
+        with self.write_lock:
+            self.write_pending()
+            with self.writer:
+                self.writer.execute('DELETE FROM ratings')
+                self.writer.executemany('INSERT INTO ratings VALUES (?, ?)', list(ratings.items()))
+
+            ratings = dict(ratings)
+            leaderboard = Leaderboard(ratings.items())
+            with self.lock:
+                for user_id, rating in self.pending.items():
+                    ratings[user_id] = rating
+                    leaderboard.update(user_id, rating)
+                self.cache = ratings
+                self.leaderboard = leaderboard
+
+
+    # Writes the pending ratings and games in one transaction
+    # Returns the number of ratings and games written
+    def flush(self):
+        with self.write_lock:
+            return self.write_pending()
+
+
+    # Takes the pending writes under the lock and writes them outside it, the caller holds write_lock
+    def write_pending(self):
+        with self.lock:
+            if not self.pending and not self.pending_games:
+                return 0
+
+            self.flushing = self.pending
+            games = self.pending_games
+            self.pending = {}
+            self.pending_games = []
+
+        written = len(self.flushing) + len(games)
+        try:
+            with self.writer:
+                self.writer.executemany('INSERT OR REPLACE INTO ratings VALUES (?, ?)', list(self.flushing.items()))
+                self.writer.executemany('INSERT INTO games (user_ids, costs) VALUES (?, ?)', games)
+
+        # The writes are pending again if the transaction failed, newer ratings are kept
+        except sqlite3.Error:
+            with self.lock:
+                self.pending = {**self.flushing, **self.pending}
+                self.pending_games = games + self.pending_games
+            raise
+
+        finally:
+            with self.lock:
+                self.flushing = {}
+
+        return written
+
+
+    def check_open(self):
+        if self.closed:
+            raise ValueError('RatingStore is closed')
+
+
+    # Flushes the pending ratings and closes the file, no rating can be set after
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+        with self.write_lock:
+            self.write_pending()
+            self.writer.close()
+            with self.lock:
+                self.connection.close()
@@ -0,0 +1,86 @@
+'''
+Rendering of the game displays for the Discord bot
+
+A display is a list of text blocks (player order, one block per hand, status lines)
+The outbox (see DaiDi_Outbox) packs the blocks into as few messages as possible,
+a Discord message holds at most 2000 characters
+
+Card emoji are looked up in a table indexed by card id
+The text of a hand is cached by its mask, so a hand is only rendered again after cards were played from it
+'''
+
+from functools import lru_cache
+from DaiDi_Cards import NUMBERS, SUIT_MASKS, mask_ids
+
+MESSAGE_LIMIT = 2000
+delimiter_string = '\_' * 20
+
+SUIT_EMOJI = (':diamonds:', ':clubs:', ':hearts:', ':spades:')
+
+# Emoji of every card, indexed by card id (e.g. '3:diamonds:')
+CARD_EMOJI = tuple(f'{NUMBERS[i >> 2]}{SUIT_EMOJI[i & 3]}' for i in range(52))
+
+
+# Returns the emoji text of a hand mask, cards sorted by value
+@lru_cache(maxsize=4096)
+def mask_text(mask):
+    return ' '.join(CARD_EMOJI[card] for card in mask_ids(mask))
+
+
+# Returns the emoji text of a hand mask, cards sorted by suits (left to right, diamond, clubs, hearts, spades)
+@lru_cache(maxsize=4096)
+def mask_suit_text(mask):
+    return ' '.join(CARD_EMOJI[card] for suit_mask in SUIT_MASKS for card in mask_ids(mask & suit_mask))
+
+
+# Function to set up a player's hand display
+# The suit sorted cards are displayed in the same line to avoid revealing information on a player's hand
+def hand_display(player):
+    return (f'{player.nickname}\'s Hand\nBy suits:\n||{mask_suit_text(player.mask)}||\n'
+            f'By value:\n||{mask_text(player.mask)}||\n{delimiter_string}')
+
+
+# Returns the text of an entry of the play area: nickname and the cards played
+def play_text(play):
+    return f'{play[1]}: {mask_text(play[3])}'
+
+
+# Returns the line with the player order
+def order_line(play_order):
+    return 'The player order is ' + ', '.join(player.nickname for player in play_order)
+
+
+# Returns the blocks of a table display: the player order, an optional status line and the hand of every player
+# hands can be given when they were already rendered (e.g. off the event loop)
+def table_display(play_order, status=None, hands=None):
+    header = order_line(play_order) if status is None else f'{order_line(play_order)}\n{status}'
+    if hands is None:
+        hands = [hand_display(player) for player in play_order]
+    return [header] + list(hands)
+
+
+# Splits a block longer than limit at line breaks, lines longer than limit are cut
+def split_block(block, limit=MESSAGE_LIMIT):
+    if len(block) <= limit:
+        return [block]
+
+    pieces = []
+    current = ''
+    for line in block.split('\n'):
+        while len(line) > limit:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:limit])
+            line = line[limit:]
+
+        if current and len(current) + 1 + len(line) <= limit:
+            current += '\n' + line
+        else:
+            if current:
+                pieces.append(current)
+            current = line
+
+    if current:
+        pieces.append(current)
+    return pieces
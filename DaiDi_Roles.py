@@ -0,0 +1,56 @@
+'''
+Cache of the role names of server members for the Discord bot
+
+Entries are keyed by user id and expire ttl seconds after they were stored
+The bot refreshes entries from member update events, so the guild is only asked on a miss
+'''
+
+from collections import OrderedDict
+from time import monotonic
+
+
+# Returns the names of the roles of a member without the @everyone role
+def role_names(member):
+    tier = set(map(lambda x: x.name, member.roles))
+    tier.discard('@everyone')
+    return tier
+
+
+# Role names keyed by user id with a time to live
+# Entries are kept in expiry order so expired entries are evicted from the front
+class RoleCache:
+    def __init__(self, ttl=600, clock=monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict() # user id: (role names, expiry time)
+
+
+    # Returns the role names of a user or None if they are not cached or expired
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+
+        if entry[1] <= self.clock():
+            del self.entries[user_id]
+            return None
+
+        return entry[0]
+
+
+    # Stores the role names of a user and evicts the expired entries
+    def set(self, user_id, roles):
+        now = self.clock()
+        self.entries[user_id] = (roles, now + self.ttl)
+        self.entries.move_to_end(user_id)
+
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            if oldest[1] > now:
+                break
+            self.entries.popitem(last=False)
+
+
+    # Removes a user from the cache
+    def remove(self, user_id):
+        self.entries.pop(user_id, None)
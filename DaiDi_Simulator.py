@@ -0,0 +1,133 @@
+'''
+Headless engine for simulating many games of Dai Di
+
+Plays games with the same play functions and costs as game_function in DaiDi_GameBot
+but without status text, printing or a new Dai_Di object per game
+The players and the play_area are reused from game to game
+
+play_area entries have the same layout as in Dai_Di: (cards, nickname, (hand type, ''), mask, key)
+Seat i is always played by play_lst[i % len(play_lst)]
+'''
+
+import numpy as np
+from random import Random
+from DaiDi_Discord_Silent import Player
+from DaiDi_Cards import BALANCE_RANGE, CARD_IDS, CARD_VALUES, mask_cards, mask_ids
+from DaiDi_Deal import balance_by_swaps
+from DaiDi_Hands import KEY_SIZE_SHIFT, key_mask
+
+# Number of invalid actions in a row after which a game is abandoned
+MAX_INVALID = 1000
+
+
+class Engine:
+    def __init__(self, play_lst, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}, seed=None):
+        self.play_lst = play_lst
+        self.objective_fn = objective_fn
+        self.rng = Random(seed)
+        self.deck = list(range(52))
+        self.play_area = []
+
+        play_len = len(play_lst)
+        self.bots = [play_lst[i % play_len] for i in range(4)]
+        self.players = [Player(nickname=self.bots[i].__name__ + str(i + 1)) for i in range(4)]
+        self.action_cost = [0, 0, 0, 0]
+
+
+    # Deals four hands with strengths within BALANCE_RANGE
+    def deal(self):
+        deck = self.deck
+        balance_by_swaps(deck, self.rng, *BALANCE_RANGE)
+
+        for i, player in enumerate(self.players):
+            mask = 0
+            for card in deck[i::4]:
+                mask |= 1 << card
+            player.mask = mask
+
+
+    # Converts the action of a play function into a mask
+    # Returns None if the action contains cards that do not exist or duplicates
+    def action_mask(self, action):
+        mask = 0
+        for card in action:
+            cid = card if isinstance(card, int) else CARD_IDS.get(card)
+            if cid is None or mask >> cid & 1:
+                return None
+            mask |= 1 << cid
+        return mask
+
+
+    # Plays one game and returns the seat of the winner
+    # The costs of the game are left in self.action_cost and in the players' hands
+    def play_game(self):
+        objective_fn = self.objective_fn
+        players = self.players
+        bots = self.bots
+        play_area = self.play_area
+        action_cost = self.action_cost
+
+        play_area.clear()
+        action_cost[:] = [0, 0, 0, 0]
+        self.deal()
+
+        turn = next(i for i in range(4) if players[i].mask & 1) # Player with the Diamond 3
+        invalid = 0
+
+        while True:
+            player = players[turn]
+            action = bots[turn](player, play_area)
+
+            # The first hand must contain the Diamond 3
+            if not play_area and not (isinstance(action, list) and (self.action_mask(action) or 0) & 1):
+                action = [('D', '3')]
+                action_cost[turn] += objective_fn['play']
+
+            if action == ['pass']:
+                if play_area and play_area[-1][1] != player.nickname:
+                    action_cost[turn] += objective_fn['pass']
+                    turn = (turn + 1) % 4
+                    invalid = 0
+                    continue
+
+            elif isinstance(action, list):
+                mask = self.action_mask(action)
+                key = None if mask is None or mask & ~player.mask else key_mask(mask)
+
+                if key is not None and (not play_area or play_area[-1][1] == player.nickname or
+                                        (key >> KEY_SIZE_SHIFT == play_area[-1][4] >> KEY_SIZE_SHIFT
+                                         and key > play_area[-1][4])):
+                    player.remove_cards(mask)
+                    play_area.append((mask_cards(mask), player.nickname, (key >> 6 & 0xF, ''), mask, key))
+                    action_cost[turn] += objective_fn['play']
+
+                    if player.mask == 0:
+                        return turn
+
+                    turn = (turn + 1) % 4
+                    invalid = 0
+                    continue
+
+                action_cost[turn] += objective_fn['invalid']
+
+            invalid += 1
+            if invalid > MAX_INVALID:
+                raise RuntimeError(f"{player.nickname} made {MAX_INVALID} invalid actions in a row")
+
+
+# Simulates n_games games between the functions in play_lst
+# Returns the card_cost, action_cost and total_cost of every seat in every game and the winning seats
+# Costs are arrays of shape (n_games, 4) and follow the definitions used by game_function
+def simulate(play_lst, n_games, seed=None, objective_fn={'play': 1, 'pass': 1, 'invalid': 1}):
+    engine = Engine(play_lst, objective_fn, seed)
+    card_cost = np.zeros((n_games, 4), dtype=np.int64)
+    action_cost = np.zeros((n_games, 4), dtype=np.int64)
+    winners = np.zeros(n_games, dtype=np.int8)
+
+    for game in range(n_games):
+        winners[game] = engine.play_game()
+        action_cost[game] = engine.action_cost
+        card_cost[game] = [sum([CARD_VALUES[card] for card in mask_ids(player.mask)])
+                           for player in engine.players]
+
+    return (card_cost, action_cost, card_cost + action_cost, winners)
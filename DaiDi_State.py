@@ -0,0 +1,129 @@
+'''
+Compact game state for search and simulation
+
+A GameState holds everything needed to carry on a game from a position and nothing else:
+the four hands as card masks, the key of the hand to beat, the seat that played it (leader),
+the number of passes since and the seat to play
+States are immutable and hashable, apply returns a new state so search can keep every state it visits
+
+Moves are card masks (see DaiDi_Cards), PASS (0) passes
+The state does not check moves, they should come from moves()
+'''
+
+from DaiDi_Cards import CARD_VALUES, DIAMOND_3, mask_ids, popcount
+from DaiDi_Hands import key_mask, legal_moves
+
+PASS = 0
+
+# Card cost of the 13 strongest cards, scores the losers of a game between 0 and 0.5
+MAX_COST = sum(sorted(CARD_VALUES)[-13:])
+
+
+class GameState:
+    __slots__ = ('hands', 'last_key', 'leader', 'passes', 'turn', 'hash')
+
+    # hands is a tuple of four masks by seat, last_key is None when the player to move can play any hand
+    # leader is None before the first hand of the game
+    def __init__(self, hands, last_key=None, leader=None, passes=0, turn=0):
+        setter = object.__setattr__
+        setter(self, 'hands', tuple(hands))
+        setter(self, 'last_key', last_key)
+        setter(self, 'leader', leader)
+        setter(self, 'passes', passes)
+        setter(self, 'turn', turn)
+        setter(self, 'hash', hash((self.hands, last_key, leader, passes, turn)))
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError('GameState is immutable')
+
+
+    # States are rebuilt from their fields, so they can be pickled, copied and sent to worker processes
+    def __reduce__(self):
+        return (GameState, (self.hands, self.last_key, self.leader, self.passes, self.turn))
+
+
+    def __hash__(self):
+        return self.hash
+
+
+    def __eq__(self, other):
+        return (isinstance(other, GameState) and self.hash == other.hash and self.hands == other.hands and
+                (self.last_key, self.leader, self.passes, self.turn) ==
+                (other.last_key, other.leader, other.passes, other.turn))
+
+
+    def __repr__(self):
+        hands = ', '.join(f'{hand:#015x}' for hand in self.hands)
+        return (f'GameState(({hands}), last_key={self.last_key}, leader={self.leader}, '
+                f'passes={self.passes}, turn={self.turn})')
+
+
+    # Returns the state at the start of a game, the player with the Diamond 3 plays first
+    @classmethod
+    def deal(cls, hands):
+        turn = next(seat for seat in range(4) if hands[seat] >> DIAMOND_3 & 1)
+        return cls(hands, turn=turn)
+
+
+    # Returns the state of a game of the bot or the simulator
+    # players are in seat order, turn is the seat to play
+    @classmethod
+    def from_players(cls, players, play_area, turn):
+        hands = [player.mask for player in players]
+        if not play_area:
+            return cls(hands, turn=turn)
+
+        # The seats between the leader and the player to move have passed
+        nickname = play_area[-1][1]
+        leader = next(seat for seat in range(4) if players[seat].nickname == nickname)
+        if leader == turn:
+            return cls(hands, None, leader, 0, turn)
+        return cls(hands, play_area[-1][4], leader, (turn - leader - 1) % 4, turn)
+
+
+    # Returns the seat that has played all their cards or None
+    def winner(self):
+        for seat in range(4):
+            if self.hands[seat] == 0:
+                return seat
+        return None
+
+
+    # Returns the number of cards of every seat
+    def card_counts(self):
+        return [popcount(hand) for hand in self.hands]
+
+
+    # Returns the score of every seat at the end of a game
+    # 1 for the winner, between 0.5 and 0 for the others depending on the cost of the cards they have left
+    def scores(self):
+        return [1.0 if hand == 0 else 0.5 * (1 - sum(CARD_VALUES[card] for card in mask_ids(hand)) / MAX_COST)
+                for hand in self.hands]
+
+
+    # Returns the moves of the player to move, weakest hand first and PASS last when it is allowed
+    # The first hand of the game must contain the Diamond 3
+    def moves(self):
+        hand = self.hands[self.turn]
+        if self.leader is None:
+            return [mask for key, mask in legal_moves(hand) if mask >> DIAMOND_3 & 1]
+
+        if self.last_key is None:
+            return [mask for key, mask in legal_moves(hand)]
+
+        return [mask for key, mask in legal_moves(hand, self.last_key)] + [PASS]
+
+
+    # Returns the state after the player to move plays a mask or passes
+    # After three passes the leader plays any hand
+    def apply(self, move):
+        turn = self.turn
+        if move == PASS:
+            if self.passes == 2:
+                return GameState(self.hands, None, self.leader, 0, (turn + 1) % 4)
+            return GameState(self.hands, self.last_key, self.leader, self.passes + 1, (turn + 1) % 4)
+
+        hands = list(self.hands)
+        hands[turn] &= ~move
+        return GameState(hands, key_mask(move), turn, 0, (turn + 1) % 4)
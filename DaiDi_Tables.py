@@ -0,0 +1,52 @@
+'''
+Game tables for the Discord bot
+
+Every table channel holds its own game, so many games can run at the same time
+A table is a dict with the same entries the bot used for its single game:
+{'game': Dai_Di(), 'ongoing': (lobby open, game started), 'order': [], 'turn': 0}
+plus the play functions of its bot seats keyed by their discord id ('bots'), the moves they are choosing ('thinking')
+and an asyncio lock so the commands of a table are handled one at a time
+'''
+
+import asyncio
+from DaiDi_Discord import Dai_Di
+
+
+# Returns a new table with no game set up
+def new_table():
+    return {'game': Dai_Di(), 'ongoing': (False, False), 'order': [], 'turn': 0, 'bots': {}, 'thinking': {}, 'lock': asyncio.Lock()}
+
+
+# Tables keyed by channel id
+# Only channels in channel_ids can hold a table, tables are created the first time they are used
+class TableManager:
+    def __init__(self, channel_ids=()):
+        self.channels = set(channel_ids)
+        self.tables = {}
+
+
+    # Returns the table of a channel or None if the channel cannot hold a table
+    def get(self, channel_id):
+        if channel_id not in self.channels:
+            return None
+
+        table = self.tables.get(channel_id)
+        if table is None:
+            table = self.tables[channel_id] = new_table()
+        return table
+
+
+    # Allows a channel to hold a table
+    def add_channel(self, channel_id):
+        self.channels.add(channel_id)
+
+
+    # Removes a channel and its table
+    def remove_channel(self, channel_id):
+        self.channels.discard(channel_id)
+        self.tables.pop(channel_id, None)
+
+
+    # Returns the tables with a game in progress
+    def ongoing(self):
+        return {channel_id: table for channel_id, table in self.tables.items() if table['ongoing'][1]}
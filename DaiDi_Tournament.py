@@ -0,0 +1,81 @@
+'''
+Multi-process tournament runner for play functions
+
+Games are split into shards that are played by DaiDi_Simulator in a pool of processes
+Every shard gets its own seed from the tournament seed, so results do not depend on the number of workers
+Shards rotate the play functions around the table so every function plays every seat
+
+Play functions must be defined at module level so they can be sent to the worker processes
+'''
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from DaiDi_Simulator import simulate
+
+
+# Plays a shard of games with the play functions rotated by rotation seats
+# Returns the number of games, the mean and the sum of squared deviations of the total cost and the wins of each seat
+def run_shard(play_lst, n_games, seed, rotation, objective_fn):
+    table = [play_lst[i % len(play_lst)] for i in range(4)]
+    table = table[rotation:] + table[:rotation]
+
+    total_cost, winners = simulate(table, n_games, seed, objective_fn)[2:]
+    mean = total_cost.mean(axis=0)
+    sq_dev = ((total_cost - mean) ** 2).sum(axis=0)
+    wins = np.bincount(winners, minlength=4)
+
+    return (n_games, mean, sq_dev, wins)
+
+
+# Merges the statistics of two groups of games (Chan et al. parallel variance)
+def merge_stats(stats, other):
+    n_a, mean_a, sq_a, wins_a = stats
+    n_b, mean_b, sq_b, wins_b = other
+    n = n_a + n_b
+    delta = mean_b - mean_a
+
+    return (n, mean_a + delta * n_b / n, sq_a + sq_b + delta ** 2 * n_a * n_b / n, wins_a + wins_b)
+
+
+# Turns merged statistics into a dictionary of summary values
+def summary(stats):
+    n, mean, sq_dev, wins = stats
+    return {'games': n, 'mean': mean.tolist(), 'variance': (sq_dev / max(n - 1, 1)).tolist(),
+            'win_rate': (wins / n).tolist()}
+
+
+# Plays n_games games between the functions in play_lst spread over worker processes
+# Returns the statistics of the total cost for each seat and for each of the four places in play_lst
+# (functions are named like in game_function, i.e. the function name + its place)
+# Raises ValueError if there are no games to play
+def tournament(play_lst, n_games, seed=0, workers=None, shard_size=1000,
+               objective_fn={'play': 1, 'pass': 1, 'invalid': 1}):
+    if n_games < 1:
+        raise ValueError(f'A tournament needs at least 1 game, not {n_games}')
+
+    n_shards = -(-n_games // shard_size)
+    seeds = [int(seq.generate_state(1)[0]) for seq in np.random.SeedSequence(seed).spawn(n_shards)]
+    sizes = [min(shard_size, n_games - i * shard_size) for i in range(n_shards)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_shard, play_lst, sizes[i], seeds[i], i % 4, objective_fn)
+                   for i in range(n_shards)]
+        results = [future.result() for future in futures]
+
+    # Merged in shard order so the results are reproducible
+    seat_stats = None
+    bot_stats = None
+    for i, stats in enumerate(results):
+        # Seat s of a shard rotated by r seats is played by place (s + r) % 4
+        order = [(place - i % 4) % 4 for place in range(4)]
+        rotated = (stats[0], stats[1][order], stats[2][order], stats[3][order])
+
+        seat_stats = stats if seat_stats is None else merge_stats(seat_stats, stats)
+        bot_stats = rotated if bot_stats is None else merge_stats(bot_stats, rotated)
+
+    names = [play_lst[i % len(play_lst)].__name__ + str(i + 1) for i in range(4)]
+    bots = summary(bot_stats)
+
+    return {'seats': summary(seat_stats),
+            'bots': {name: {key: (value[i] if isinstance(value, list) else value) for key, value in bots.items()}
+                     for i, name in enumerate(names)}}
@@ -0,0 +1,55 @@
+'''
+Tests of the outbound message queue, run with pytest
+'''
+
+import asyncio
+from DaiDi_Outbox import INFO, PROMPT, STATUS, FakeChannel, FakeTransport, Outbox, SlidingWindow
+
+
+# Posts messages too long to merge on a few channels and sends them all through an Outbox
+# Returns the transport
+def send_all(n_channels=4, n_messages=40, period=0.05, latency=0.001):
+    limit = (5, period)
+    transport = FakeTransport(latency, limit)
+    channels = [FakeChannel(i) for i in range(n_channels)]
+
+    async def run():
+        outbox = Outbox(transport, limit, (50, period), limit=10)
+        scheduler = asyncio.ensure_future(outbox.run())
+        for i in range(n_messages):
+            for channel in channels:
+                outbox.post(channel, f'message {i:2}', (PROMPT, STATUS, INFO)[i % 3])
+            await asyncio.sleep(period / 20)
+        await outbox.drain(interval=0.001)
+        scheduler.cancel()
+
+    asyncio.run(run())
+    return transport
+
+
+def test_channel_limit():
+    for _ in range(3):
+        transport = send_all()
+        assert len(transport.sent) == 4 * 40
+        assert transport.limited == 0
+
+
+def test_messages_keep_their_order():
+    transport = send_all(n_channels=2, n_messages=30)
+    for channel_id in range(2):
+        texts = [text for time, sent_id, text in transport.sent if sent_id == channel_id]
+        assert texts == [f'message {i:2}' for i in range(30)]
+
+
+def test_sliding_window():
+    now = [0.0]
+    window = SlidingWindow(2, 1.0, clock=lambda: now[0])
+    window.take()
+    window.take()
+    assert window.wait_time() == 1.0
+
+    now[0] = 0.5
+    assert window.wait_time() == 0.5
+
+    now[0] = 1.0
+    assert window.wait_time() == 0
@@ -0,0 +1,20 @@
+'''
+Tests of the tournament runner, run with pytest
+'''
+
+import pytest
+from DaiDi_GameBot import weakest
+from DaiDi_Tournament import tournament
+
+
+def test_no_games():
+    for n_games in (0, -1):
+        with pytest.raises(ValueError):
+            tournament([weakest], n_games)
+
+
+def test_games_are_counted():
+    results = tournament([weakest], 5, workers=2, shard_size=2)
+    assert results['seats']['games'] == 5
+    assert sum(results['seats']['win_rate']) == pytest.approx(1)
+    assert all(stats['games'] == 5 for stats in results['bots'].values())